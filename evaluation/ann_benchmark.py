@@ -0,0 +1,70 @@
+import sys
+from pathlib import Path
+
+import faiss
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from src.config.settings import settings
+from src.services.ann_index import benchmark, build_index, search_parameters
+
+
+def synthetic_corpus(
+    size: int, dimension: int = 1536, clusters: int = 200, seed: int = 0
+) -> np.ndarray:
+    """
+    Clustered, L2-normalized vectors: listings of one district/kind sit close
+    together, which is where ANN indexes lose recall.
+    """
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(size=(clusters, dimension)).astype("float32")
+    labels = rng.integers(0, clusters, size)
+    noise = rng.normal(scale=0.5, size=(size, dimension)).astype("float32")
+    vectors = centers[labels] + noise
+    faiss.normalize_L2(vectors)
+    return vectors
+
+
+def run_ann_benchmark(
+    embeddings: np.ndarray, num_queries: int = 500, k: int = 10
+) -> None:
+    """Recall@k and latency of each index type and tuning against exact search."""
+    rng = np.random.default_rng(1)
+    queries = embeddings[rng.choice(len(embeddings), num_queries, replace=False)]
+    queries = queries + rng.normal(scale=0.05, size=queries.shape).astype("float32")
+    faiss.normalize_L2(queries)
+
+    exact = build_index(embeddings, "flat")
+    print(f"Corpus: {len(embeddings)} x {embeddings.shape[1]}, queries: {num_queries}")
+    _, flat_ms = benchmark(exact, exact, queries, k)
+    print(f"{'flat':<8} {'-':<14} recall@{k}: 1.0000 | {flat_ms:.3f} ms/query")
+
+    sweeps: dict[str, tuple[str, list[int]]] = {
+        "hnsw": ("efSearch", [16, 32, 64, 128, 256]),
+        "ivf": ("nprobe", [1, 4, 16, 64]),
+        "ivfpq": ("nprobe", [1, 4, 16, 64]),
+    }
+    for kind, (knob, values) in sweeps.items():
+        index = build_index(embeddings, kind)
+        for value in values:
+            if knob == "efSearch":
+                settings.ANN_EF_SEARCH = value
+            else:
+                settings.ANN_NPROBE = value
+            recall, ms = benchmark(index, exact, queries, k, search_parameters(index))
+            print(
+                f"{kind:<8} {knob}={value:<5} recall@{k}: {recall:.4f} | {ms:.3f} ms/query"
+            )
+
+
+if __name__ == "__main__":
+    EMBEDDINGS_PATH = sys.argv[1] if len(sys.argv) > 1 else None
+
+    if EMBEDDINGS_PATH:
+        vectors = np.load(EMBEDDINGS_PATH).astype("float32")
+        faiss.normalize_L2(vectors)
+    else:
+        vectors = synthetic_corpus(50_000)
+
+    run_ann_benchmark(vectors)
@@ -0,0 +1,191 @@
+import base64
+import gzip
+import hashlib
+import json
+import threading
+from pathlib import Path
+
+import httpx
+import openai
+import instructor
+
+from src.services.api_client import KrishaClient
+from src.services.llm_service import QueryParser
+from src.services.reranker import JinaReranker
+from src.services.vector_store import VectorEngine
+
+# Only headers that change how a response body is read are kept.
+KEPT_HEADERS = ("content-type",)
+
+# Krisha credentials travel as query parameters; they are removed from
+# the URL before it is hashed or logged.
+CREDENTIAL_PARAMS = ("appId", "appKey")
+
+
+class CassetteMiss(RuntimeError):
+    """A request was not recorded and the cassette is replay-only."""
+
+
+class Cassette:
+    """
+    Records HTTP exchanges of the upstream clients (OpenAI, Jina, Krisha)
+    and replays them without network access.
+
+    Requests are keyed by a fingerprint of method, URL and body, with
+    credentials excluded (auth headers and Krisha's key parameters), so
+    replay does not depend on call order, batch timing or whose keys
+    recorded the cassette. The file is gzip-compressed JSON: OpenAI already returns
+    embeddings base64-encoded, so responses stay compact.
+    """
+
+    def __init__(self, path: str | Path, record: bool = False):
+        self.path = Path(path)
+        self.record = record
+        self.entries: dict[str, dict] = {}
+        self.hits = 0
+        self.recorded = 0
+        # Replay misses. Clients may swallow the error and fall back
+        # (local embeddings, unreranked order), so the runner checks this.
+        self.misses = 0
+        # Embedding batches are recorded from several threads.
+        self._lock = threading.Lock()
+        if self.path.exists():
+            with gzip.open(self.path, "rt", encoding="utf-8") as f:
+                self.entries = json.load(f)
+        elif not record:
+            raise FileNotFoundError(
+                f"No cassette at {self.path}; run once with --record first"
+            )
+
+    def save(self):
+        if not self.recorded:
+            return
+        with gzip.open(self.path, "wt", encoding="utf-8") as f:
+            json.dump(self.entries, f, sort_keys=True, separators=(",", ":"))
+
+    @staticmethod
+    def public_url(request: httpx.Request) -> str:
+        url = request.url
+        for name in CREDENTIAL_PARAMS:
+            url = url.copy_remove_param(name)
+        return str(url)
+
+    @staticmethod
+    def fingerprint(request: httpx.Request) -> str:
+        body = request.content
+        try:
+            body = json.dumps(json.loads(body), sort_keys=True).encode("utf-8")
+        except ValueError:
+            pass
+        digest = hashlib.sha256()
+        url = Cassette.public_url(request)
+        for part in (request.method.encode(), url.encode(), body):
+            digest.update(part)
+            digest.update(b"\0")
+        return digest.hexdigest()
+
+    def lookup(self, request: httpx.Request) -> tuple[str, httpx.Response | None]:
+        key = self.fingerprint(request)
+        entry = self.entries.get(key)
+        if entry is not None:
+            with self._lock:
+                self.hits += 1
+            return key, httpx.Response(
+                entry["status"],
+                headers=entry["headers"],
+                content=base64.b64decode(entry["body"]),
+                request=request,
+            )
+        if not self.record:
+            with self._lock:
+                self.misses += 1
+            raise CassetteMiss(
+                f"Unrecorded request: {request.method} {self.public_url(request)}"
+            )
+        return key, None
+
+    def store(
+        self, key: str, request: httpx.Request, response: httpx.Response
+    ) -> httpx.Response:
+        headers = {
+            name: response.headers[name]
+            for name in KEPT_HEADERS
+            if name in response.headers
+        }
+        with self._lock:
+            self.entries[key] = {
+                "status": response.status_code,
+                "headers": headers,
+                "body": base64.b64encode(response.content).decode("ascii"),
+            }
+            self.recorded += 1
+        # The body is already decoded, so drop transfer/encoding headers.
+        return httpx.Response(
+            response.status_code,
+            headers=headers,
+            content=response.content,
+            request=request,
+        )
+
+    def async_client(self, **kwargs) -> httpx.AsyncClient:
+        return httpx.AsyncClient(transport=_AsyncTransport(self, **kwargs))
+
+    def sync_client(self) -> httpx.Client:
+        return httpx.Client(transport=_SyncTransport(self))
+
+    def attach(self, service):
+        """Routes a service's HTTP client through the cassette."""
+        if isinstance(service, VectorEngine):
+            if service.client is None:
+                return service  # Local embeddings make no requests.
+            service.client = openai.OpenAI(
+                api_key=service.client.api_key, http_client=self.sync_client()
+            )
+        elif isinstance(service, QueryParser):
+            service.openai = openai.AsyncOpenAI(
+                api_key=service.openai.api_key, http_client=self.async_client()
+            )
+            service.client = instructor.from_openai(service.openai)
+        elif isinstance(service, JinaReranker):
+            service.client = self.async_client()
+        elif isinstance(service, KrishaClient):
+            service.client = self.async_client(http2=True)
+        else:
+            raise TypeError(f"Cannot attach a cassette to {type(service).__name__}")
+        return service
+
+
+class _AsyncTransport(httpx.AsyncBaseTransport):
+    def __init__(self, cassette: Cassette, **kwargs):
+        self.cassette = cassette
+        self.inner = httpx.AsyncHTTPTransport(**kwargs)
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        await request.aread()
+        key, response = self.cassette.lookup(request)
+        if response is not None:
+            return response
+        response = await self.inner.handle_async_request(request)
+        await response.aread()
+        return self.cassette.store(key, request, response)
+
+    async def aclose(self):
+        await self.inner.aclose()
+
+
+class _SyncTransport(httpx.BaseTransport):
+    def __init__(self, cassette: Cassette):
+        self.cassette = cassette
+        self.inner = httpx.HTTPTransport()
+
+    def handle_request(self, request: httpx.Request) -> httpx.Response:
+        request.read()
+        key, response = self.cassette.lookup(request)
+        if response is not None:
+            return response
+        response = self.inner.handle_request(request)
+        response.read()
+        return self.cassette.store(key, request, response)
+
+    def close(self):
+        self.inner.close()
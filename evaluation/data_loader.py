@@ -1,6 +1,7 @@
 import json
 
 from models import EvalCase
+from src.models import Advert
 
 
 def load_eval_dataset(file_path: str) -> list[EvalCase]:
@@ -19,3 +20,22 @@ def load_eval_dataset(file_path: str) -> list[EvalCase]:
     except json.JSONDecodeError:
         print(f"Error: Failed to decode JSON from {file_path}")
         return []
+
+
+def load_snapshot(file_path: str) -> list[Advert]:
+    """Loads the mock database snapshot into Advert objects."""
+    with open(file_path, encoding="utf-8") as f:
+        data = json.load(f)
+
+    adverts = []
+    for item in data:
+        ad = Advert(
+            id=item["id"],
+            title=item["title"],
+            price=item["price"],
+            address=item["address"],
+            full_text_content=item["full_text_content"],
+            url=f"http://mock/{item['id']}",
+        )
+        adverts.append(ad)
+    return adverts
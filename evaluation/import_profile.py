@@ -0,0 +1,79 @@
+import re
+import subprocess
+import sys
+from pathlib import Path
+
+ROOT = Path(__file__).parent.parent
+OUTPUT_PATH = Path(__file__).parent / "import_profile.txt"
+
+# What each entry point imports before it can do anything useful.
+TARGETS = {
+    "CLI (main.py)": "import src.interfaces.cli.console",
+    "Web UI (app.py)": "import src.interfaces.web.chat",
+    "Search stack (after load_dependencies)": (
+        "from src.services.container import load_dependencies; load_dependencies()"
+    ),
+}
+
+LINE = re.compile(r"import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)")
+
+
+def profile(statement: str) -> tuple[int, list[tuple[int, str]]]:
+    """
+    Runs `statement` in a fresh interpreter with -X importtime.
+    Returns (total microseconds, [(cumulative us, package)]). A package is
+    charged the cumulative time of the import that first pulled it in, so
+    the numbers of nested packages overlap.
+    """
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", statement],
+        cwd=ROOT,
+        capture_output=True,
+        text=True,
+    )
+    if result.returncode != 0:
+        raise RuntimeError(result.stderr.strip().splitlines()[-1])
+
+    # -X importtime prints children before their parent; reversed, each
+    # line's parent is the closest earlier line with a smaller indent.
+    entries = [(len(m[3]), int(m[2]), m[4]) for m in LINE.finditer(result.stderr)][::-1]
+    packages: dict[str, int] = {}
+    total = 0
+    stack: list[tuple[int, str]] = []
+    for indent, cumulative, name in entries:
+        while stack and stack[-1][0] >= indent:
+            stack.pop()
+        root = name.split(".")[0]
+        if not stack:
+            total += cumulative
+        if not stack or stack[-1][1] != root:
+            packages[root] = packages.get(root, 0) + cumulative
+        stack.append((indent, root))
+    heaviest = sorted(((us, name) for name, us in packages.items()), reverse=True)
+    return total, heaviest
+
+
+def run_import_profile(top: int = 10) -> str:
+    lines = [
+        f"Python {sys.version.split()[0]}, cold imports (-X importtime).",
+        "Per package: cumulative time of the import that first loaded it.",
+        "",
+    ]
+    for label, statement in TARGETS.items():
+        try:
+            total, heaviest = profile(statement)
+        except RuntimeError as e:
+            lines += [f"=== {label} ===", f"  not measured: {e}", ""]
+            continue
+        lines.append(f"=== {label}: {total / 1000:.0f} ms ===")
+        for us, name in heaviest[:top]:
+            lines.append(f"  {us / 1000:8.1f} ms  {name}")
+        lines.append("")
+    return "\n".join(lines)
+
+
+if __name__ == "__main__":
+    report = run_import_profile()
+    print(report)
+    OUTPUT_PATH.write_text(report, encoding="utf-8")
+    print(f"Saved to {OUTPUT_PATH}")
@@ -1,5 +1,7 @@
 import math
 
+import numpy as np
+
 
 def calculate_precision_at_k(retrieved: list[int], relevant: set[int], k: int) -> float:
     """
@@ -66,3 +68,45 @@ def calculate_ndcg_at_k(retrieved: list[int], relevant: set[int], k: int) -> flo
     if idcg == 0:
         return 0.0
     return dcg / idcg
+
+
+def calculate_batch_metrics(
+    hits: np.ndarray, returned: np.ndarray, num_relevant: np.ndarray, k: int
+) -> dict[str, np.ndarray]:
+    """
+    Vectorized form of the metrics above over any batch of ranked lists
+    (configs x cases, ...). `hits[..., i]` tells whether the i-th returned
+    item is relevant (False past the end of a list), `returned` is each
+    list's length and `num_relevant` the size of its ground truth.
+    """
+    hits = hits[..., :k].astype(float)
+    returned = np.minimum(returned, k)
+    num_relevant = np.broadcast_to(num_relevant, returned.shape)
+    found = hits.sum(axis=-1)
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        precision = np.where(returned > 0, found / returned, 0.0)
+        recall = np.where(num_relevant > 0, found / num_relevant, 0.0)
+        f1 = np.where(
+            precision + recall > 0,
+            2 * precision * recall / (precision + recall),
+            0.0,
+        )
+
+    ranks = np.arange(1, hits.shape[-1] + 1)
+    first_hit = np.where(hits.any(axis=-1), hits.argmax(axis=-1) + 1, 0)
+    mrr = np.where(first_hit > 0, 1.0 / np.maximum(first_hit, 1), 0.0)
+
+    discounts = 1.0 / np.log2(ranks + 1)
+    dcg = (hits * discounts).sum(axis=-1)
+    ideal = np.cumsum(1.0 / np.log2(np.arange(1, k + 1) + 1))
+    idcg = np.where(num_relevant > 0, ideal[np.clip(num_relevant, 1, k) - 1], 0.0)
+    ndcg = np.where((idcg > 0) & (returned > 0), dcg / np.maximum(idcg, 1e-12), 0.0)
+
+    return {
+        "precision": precision,
+        "recall": recall,
+        "f1": f1,
+        "mrr": mrr,
+        "ndcg": ndcg,
+    }
@@ -1,12 +1,13 @@
+import argparse
 import asyncio
-import json
 import sys
+import time
 from pathlib import Path
 from statistics import mean
 
 sys.path.insert(0, str(Path(__file__).parent.parent))
 
-from data_loader import load_eval_dataset
+from data_loader import load_eval_dataset, load_snapshot
 from metrics import (
     calculate_f1_at_k,
     calculate_mrr_at_k,
@@ -15,37 +16,29 @@ from metrics import (
     calculate_recall_at_k,
 )
 
+from cassette import Cassette
 from models import MetricResult
-from src.models.models import Advert
+from sweep import OUTPUT_PATH as SWEEP_OUTPUT_PATH, run_sweep
+from src.config.cache import cache
+from src.config.settings import settings
 from src.services.reranker import JinaReranker
 from src.services.vector_store import VectorEngine
 
 
-def load_snapshot(file_path: str) -> list[Advert]:
-    """Loads the mock database snapshot into Advert objects."""
-    with open(file_path, encoding="utf-8") as f:
-        data = json.load(f)
-
-    adverts = []
-    for item in data:
-        ad = Advert(
-            id=item["id"],
-            title=item["title"],
-            price=item["price"],
-            address=item["address"],
-            full_text_content=item["full_text_content"],
-            url=f"http://mock/{item['id']}",
-        )
-        adverts.append(ad)
-    return adverts
-
-
 async def run_pipeline_evaluation(
     dataset_path: str,
     snapshot_path: str,
     top_k_retrieval: int = 50,
     top_k_rerank: int = 5,
-):
+    cassette: Cassette | None = None,
+) -> dict[str, float]:
+    """
+    Runs every case through hybrid search and reranking and prints the
+    metrics. Returns the aggregate metrics (empty if there were no cases).
+    With a cassette, upstream calls are recorded or replayed from disk.
+    """
+    started = time.monotonic()
+    cache.setup("mem://")
     print(f"Loading Test Cases from: {dataset_path}")
     cases = load_eval_dataset(dataset_path)
 
@@ -55,9 +48,12 @@ async def run_pipeline_evaluation(
 
     print("Indexing data in Vector Engine...")
     engine = VectorEngine()
+    reranker = JinaReranker()
+    if cassette is not None:
+        cassette.attach(engine)
+        cassette.attach(reranker)
     engine.index_data(real_adverts)
 
-    reranker = JinaReranker()
     results: list[MetricResult] = []
 
     print(
@@ -111,25 +107,90 @@ async def run_pipeline_evaluation(
         print(f"  P: {p_k:.2f} | R: {r_k:.2f} | NDCG: {ndcg_k:.2f}")
         print("-" * 50)
 
-    if results:
-        avg_precision = mean(r.precision_at_k for r in results)
-        avg_recall = mean(r.recall_at_k for r in results)
-        avg_f1 = mean(r.f1_at_k for r in results)
-        avg_mrr = mean(r.mrr_at_k for r in results)
-        avg_ndcg = mean(r.ndcg_at_k for r in results)
-
-        print("\n=== Final Aggregate Metrics ===")
-        print(f"Total Cases:       {len(cases)}")
-        print(f"Average Precision: {avg_precision:.4f}")
-        print(f"Average Recall:    {avg_recall:.4f}")
-        print(f"Average F1 Score:  {avg_f1:.4f}")
-        print(f"Average MRR:       {avg_mrr:.4f}")
-        print(f"Average NDCG:      {avg_ndcg:.4f}")
-        print("===============================")
+    if not results:
+        return {}
+
+    aggregate = {
+        "precision": mean(r.precision_at_k for r in results),
+        "recall": mean(r.recall_at_k for r in results),
+        "f1": mean(r.f1_at_k for r in results),
+        "mrr": mean(r.mrr_at_k for r in results),
+        "ndcg": mean(r.ndcg_at_k for r in results),
+    }
+    print("\n=== Final Aggregate Metrics ===")
+    print(f"Total Cases:       {len(cases)}")
+    print(f"Average Precision: {aggregate['precision']:.4f}")
+    print(f"Average Recall:    {aggregate['recall']:.4f}")
+    print(f"Average F1 Score:  {aggregate['f1']:.4f}")
+    print(f"Average MRR:       {aggregate['mrr']:.4f}")
+    print(f"Average NDCG:      {aggregate['ndcg']:.4f}")
+    print(f"Wall time:         {time.monotonic() - started:.2f}s")
+    print("===============================")
+    return aggregate
 
 
 if __name__ == "__main__":
     DATASET_PATH = "datasets/synthetic_rag_data.json"
     SNAPSHOT_PATH = "datasets/snapshot.json"
-
-    asyncio.run(run_pipeline_evaluation(DATASET_PATH, SNAPSHOT_PATH))
+    CASSETTE_PATH = "datasets/eval_cassette.json.gz"
+
+    parser = argparse.ArgumentParser(description="Offline retrieval evaluation.")
+    # Live by default until a recorded cassette is committed; CI replays
+    # one with --replay.
+    cassette_mode = parser.add_mutually_exclusive_group()
+    cassette_mode.add_argument(
+        "--replay",
+        action="store_true",
+        help="replay API calls from the cassette, failing on unrecorded ones",
+    )
+    cassette_mode.add_argument(
+        "--record",
+        action="store_true",
+        help="replay recorded API calls and record the missing ones",
+    )
+    parser.add_argument("--cassette", default=CASSETTE_PATH)
+    parser.add_argument(
+        "--sweep",
+        action="store_true",
+        help="evaluate a grid of fusion/retrieval/threshold settings instead",
+    )
+    parser.add_argument(
+        "--min-ndcg",
+        type=float,
+        default=0.0,
+        help="exit with status 1 if average NDCG falls below this (CI gate)",
+    )
+    args = parser.parse_args()
+
+    if args.replay:
+        # A miss must fail the run, not fall back to local embeddings.
+        settings.EMBEDDING_FALLBACK = False
+    cassette = (
+        Cassette(args.cassette, record=args.record)
+        if args.replay or args.record
+        else None
+    )
+    try:
+        if args.sweep:
+            report = asyncio.run(run_sweep(DATASET_PATH, SNAPSHOT_PATH, cassette))
+            print(report)
+            SWEEP_OUTPUT_PATH.write_text(report, encoding="utf-8")
+            print(f"Saved to {SWEEP_OUTPUT_PATH}")
+            aggregate = {}
+        else:
+            aggregate = asyncio.run(
+                run_pipeline_evaluation(DATASET_PATH, SNAPSHOT_PATH, cassette=cassette)
+            )
+    finally:
+        if cassette is not None:
+            cassette.save()
+            print(
+                f"Cassette: {cassette.hits} replayed, {cassette.recorded} recorded, "
+                f"{cassette.misses} missed"
+            )
+    if cassette is not None and cassette.misses:
+        print(f"FAIL: {cassette.misses} requests were not in the cassette")
+        sys.exit(1)
+    if not args.sweep and aggregate.get("ndcg", 0.0) < args.min_ndcg:
+        print(f"FAIL: NDCG below {args.min_ndcg}")
+        sys.exit(1)
@@ -0,0 +1,189 @@
+import time
+from itertools import product
+from pathlib import Path
+
+import numpy as np
+
+from cassette import Cassette
+from data_loader import load_eval_dataset, load_snapshot
+from metrics import calculate_batch_metrics
+from src.config.cache import cache
+from src.services.ann_index import build_index
+from src.services.reranker import JinaReranker
+from src.services.vector_store import VectorEngine
+
+OUTPUT_PATH = Path(__file__).parent / "sweep_results.txt"
+
+# The grid: fusion weight, dense candidate depth, documents sent to the
+# reranker, and rerank relevance threshold.
+ALPHAS = [0.0, 0.3, 0.5, 0.6, 0.7, 0.8, 0.9, 1.0]
+SEARCH_KS = [20, 50, 100]
+TOP_K_RETRIEVALS = [10, 20, 30, 50]
+THRESHOLDS = [0.0, 0.2, 0.3, 0.35, 0.4, 0.5]
+TOP_K_RERANK = 5
+
+
+def rank_positions(scores: np.ndarray) -> np.ndarray:
+    """Position of every document when sorted by descending score."""
+    order = np.argsort(-scores, axis=-1, kind="stable")
+    return np.argsort(order, axis=-1, kind="stable")
+
+
+def fused_retrieval(
+    vector: np.ndarray, bm25: np.ndarray
+) -> tuple[np.ndarray, np.ndarray]:
+    """
+    What `VectorEngine.fuse` retrieves for every (alpha, search_k, top_k)
+    config at once. `vector` and `bm25` are (cases x docs) score matrices.
+    Returns a boolean (alphas x search_ks x top_ks x cases x docs) mask of
+    retrieved documents, and the mean number retrieved per config.
+    """
+    depths = np.array(SEARCH_KS)[:, None, None]
+    candidates = rank_positions(vector)[None] < depths
+
+    # BM25 is normalized by its maximum over each query's candidates.
+    bm25 = np.where(candidates, bm25[None], 0.0)
+    peak = bm25.max(axis=-1, keepdims=True)
+    bm25 = np.where(peak > 0, bm25 / np.where(peak > 0, peak, 1.0), bm25)
+
+    alphas = np.array(ALPHAS)[:, None, None, None]
+    hybrid = alphas * vector[None, None] + (1 - alphas) * bm25[None]
+    hybrid = np.where(candidates[None], hybrid, -np.inf)
+
+    top_ks = np.array(TOP_K_RETRIEVALS)[:, None, None]
+    retrieved = (rank_positions(hybrid)[:, :, None] < top_ks) & candidates[
+        None, :, None
+    ]
+    return retrieved, retrieved.sum(axis=-1).mean(axis=-1)
+
+
+def reranked_metrics(
+    retrieved: np.ndarray,
+    rerank: np.ndarray,
+    relevant: np.ndarray,
+) -> dict[str, np.ndarray]:
+    """
+    Applies every threshold to the rerank scores of each retrieved set and
+    scores the resulting top lists. Returns metrics averaged over cases,
+    shaped (alphas x search_ks x top_ks x thresholds).
+    """
+    thresholds = np.array(THRESHOLDS)[:, None, None]
+    with np.errstate(invalid="ignore"):
+        kept = retrieved[..., None, :, :] & (rerank[None] >= thresholds)
+    scores = np.where(kept, rerank, -np.inf)
+    order = np.argsort(-scores, axis=-1, kind="stable")[..., :TOP_K_RERANK]
+    valid = np.take_along_axis(scores, order, axis=-1) > -np.inf
+    hits = np.take_along_axis(np.broadcast_to(relevant, scores.shape), order, -1)
+    metrics = calculate_batch_metrics(
+        hits & valid, valid.sum(axis=-1), relevant.sum(axis=-1), TOP_K_RERANK
+    )
+    return {name: values.mean(axis=-1) for name, values in metrics.items()}
+
+
+def search_latency(
+    embeddings: np.ndarray, queries: np.ndarray, bm25: np.ndarray, repeats: int = 20
+) -> dict[tuple[int, int], float]:
+    """Milliseconds per query of dense search + fusion per (search_k, top_k)."""
+    index = build_index(embeddings)
+    latency = {}
+    for search_k, top_k in product(SEARCH_KS, TOP_K_RETRIEVALS):
+        started = time.perf_counter()
+        for _ in range(repeats):
+            for query, scores in zip(queries, bm25):
+                distances, indices = index.search(
+                    query[None], min(search_k, len(embeddings))
+                )
+                VectorEngine.fuse(indices[0], distances[0], scores[indices[0]], top_k)
+        elapsed = time.perf_counter() - started
+        latency[(search_k, top_k)] = elapsed * 1000 / (repeats * len(queries))
+    return latency
+
+
+async def run_sweep(
+    dataset_path: str, snapshot_path: str, cassette: Cassette | None = None
+) -> str:
+    """
+    Embeds the snapshot and the queries and scores BM25 and the reranker
+    once, then evaluates the whole grid as array operations. Returns the
+    table of configs, best NDCG first.
+    """
+    cache.setup("mem://")
+    cases = load_eval_dataset(dataset_path)
+    adverts = load_snapshot(snapshot_path)
+    ids = np.array([ad.id for ad in adverts])
+    print(f"Sweep: {len(cases)} cases x {len(adverts)} adverts")
+
+    engine = VectorEngine()
+    reranker = JinaReranker()
+    if cassette is not None:
+        cassette.attach(engine)
+        cassette.attach(reranker)
+
+    started = time.monotonic()
+    engine.prepare_corpus(ad.full_text_content for ad in adverts)
+    embeddings = engine.embed(engine.corpus)
+    # One request per query, as the runner sends them, so a recorded
+    # cassette serves both.
+    queries = np.vstack([engine.embed([case.query]) for case in cases])
+    vector = queries @ embeddings.T
+    bm25 = np.vstack([engine.bm25_scores(case.query) for case in cases])
+    relevant = np.array([np.isin(ids, list(case.relevant_ids)) for case in cases])
+
+    retrieved, sent = fused_retrieval(vector, bm25)
+    # Rerank scores do not depend on the other documents in a request, so
+    # every document any config retrieves is scored once per query.
+    rerank = np.full(vector.shape, np.nan)
+    pool = retrieved.any(axis=(0, 1, 2))
+    for case_index, case in enumerate(cases):
+        rows = np.flatnonzero(pool[case_index])
+        ranked = await reranker.rerank_documents(
+            case.query,
+            [adverts[row].full_text_content for row in rows],
+            top_k=len(rows),
+            threshold=-np.inf,
+        )
+        for position, score in ranked:
+            rerank[case_index, rows[position]] = score
+    print(f"Scores computed in {time.monotonic() - started:.2f}s")
+
+    started = time.monotonic()
+    metrics = reranked_metrics(retrieved, rerank, relevant)
+    print(
+        f"Grid of {metrics['ndcg'].size} configs in {time.monotonic() - started:.3f}s"
+    )
+    latency = search_latency(embeddings, queries, bm25)
+
+    rows = []
+    for (a, alpha), (s, search_k), (k, top_k), (t, threshold) in product(
+        enumerate(ALPHAS),
+        enumerate(SEARCH_KS),
+        enumerate(TOP_K_RETRIEVALS),
+        enumerate(THRESHOLDS),
+    ):
+        config = (a, s, k, t)
+        rows.append(
+            (
+                metrics["ndcg"][config],
+                metrics["mrr"][config],
+                -sent[a, s, k],
+                f"{alpha:>5.2f} {search_k:>8} {top_k:>6} {threshold:>9.2f} "
+                f"{metrics['ndcg'][config]:>7.4f} {metrics['mrr'][config]:>7.4f} "
+                f"{metrics['recall'][config]:>7.4f} "
+                f"{metrics['precision'][config]:>7.4f} "
+                f"{sent[a, s, k]:>7.1f} {latency[(search_k, top_k)]:>9.3f}",
+            )
+        )
+    rows.sort(reverse=True)
+    header = (
+        f"{'alpha':>5} {'search_k':>8} {'top_k':>6} {'threshold':>9} "
+        f"{'NDCG':>7} {'MRR':>7} {'Recall':>7} {'Prec.':>7} "
+        f"{'Reranked':>7} {'Search ms':>9}"
+    )
+    lines = [
+        f"Sweep over {len(cases)} cases, top {TOP_K_RERANK} after rerank.",
+        "Reranked: documents sent to the reranker per query (its cost).",
+        "Search ms: dense search + fusion per query, this machine.",
+        "",
+        header,
+    ]
+    return "\n".join(lines + [row[-1] for row in rows])
@@ -1,3 +1,116 @@
+import asyncio
+import time
+from functools import wraps
+from typing import Any, Awaitable, Callable, Dict, Set, TypeVar
 from cashews import Cache
+from cashews.key import get_cache_key, get_cache_key_template
+from cashews.ttl import ttl_to_seconds
+from loguru import logger
 
 cache = Cache()
+
+F = TypeVar("F", bound=Callable[..., Awaitable[Any]])
+
+# Refresh-ahead kicks in during this last share of an entry's freshness.
+REFRESH_AHEAD_SHARE = 0.2
+
+_refreshing: Set[str] = set()
+_background: Set[asyncio.Task] = set()
+
+
+def stale_while_revalidate(
+    key: str,
+    ttl: str,
+    stale_ttl: str,
+    negative_ttl: str = "1m",
+    is_negative: Callable[[Any], bool] = lambda result: False,
+    refresh_hits: int = 0,
+) -> Callable[[F], F]:
+    """
+    Caches results for `ttl`, then keeps serving them for up to `stale_ttl`
+    more while one background call refreshes the entry, so expiry never
+    puts an upstream call on the request path.
+
+    Results for which `is_negative` is true (failed fetches) are kept only
+    for `negative_ttl` and never replace a good entry; a stale good entry
+    is served on, but refetched only once `negative_ttl` has passed, so an
+    outage does not cost an upstream call per read. With `refresh_hits`,
+    an entry read that often near the end of its freshness is refreshed
+    before it goes stale. Exceptions are not cached.
+    """
+    fresh_seconds = float(ttl_to_seconds(ttl) or 0)
+    stale_seconds = float(ttl_to_seconds(stale_ttl) or 0)
+    negative_seconds = float(ttl_to_seconds(negative_ttl) or 0)
+
+    def decorator(func: F) -> F:
+        template = get_cache_key_template(func, key=key, prefix="swr")
+
+        async def load(cache_key: str, args: Any, kwargs: Dict[str, Any]) -> Any:
+            result = await func(*args, **kwargs)
+            negative = is_negative(result)
+            if negative:
+                entry = await cache.get(cache_key)
+                if entry is not None and not entry[2]:
+                    # Back off: the good entry counts as fresh (without
+                    # refresh-ahead) for `negative_ttl`, within its lifetime.
+                    expire = await cache.get_expire(cache_key)
+                    await cache.set(
+                        cache_key,
+                        (time.time() + negative_seconds, entry[1], False, True),
+                        expire=expire if expire > 0 else negative_seconds,
+                    )
+                    return entry[1]
+                fresh, expire = negative_seconds, negative_seconds
+            else:
+                fresh, expire = fresh_seconds, fresh_seconds + stale_seconds
+            # (fresh until, result, negative, backing off)
+            await cache.set(
+                cache_key,
+                (time.time() + fresh, result, negative, False),
+                expire=expire,
+            )
+            return result
+
+        def refresh(cache_key: str, args: Any, kwargs: Dict[str, Any]):
+            if cache_key in _refreshing:
+                return
+            _refreshing.add(cache_key)
+
+            async def run():
+                try:
+                    await load(cache_key, args, kwargs)
+                except Exception as e:
+                    logger.warning(f"Background refresh of {cache_key} failed: {e}")
+                finally:
+                    _refreshing.discard(cache_key)
+
+            task = asyncio.create_task(run())
+            _background.add(task)
+            task.add_done_callback(_background.discard)
+
+        @wraps(func)
+        async def wrapper(*args: Any, **kwargs: Any) -> Any:
+            cache_key = get_cache_key(func, template, args, kwargs)
+            entry = await cache.get(cache_key)
+            if entry is None:
+                return await load(cache_key, args, kwargs)
+
+            fresh_until, result, negative, backing_off = entry
+            remaining = fresh_until - time.time()
+            if remaining <= 0:
+                refresh(cache_key, args, kwargs)
+            elif (
+                refresh_hits
+                and not negative
+                and not backing_off
+                and remaining < fresh_seconds * REFRESH_AHEAD_SHARE
+            ):
+                hits_key = f"{cache_key}:hits"
+                if await cache.incr(hits_key, expire=remaining) >= refresh_hits:
+                    await cache.delete(hits_key)
+                    refresh(cache_key, args, kwargs)
+            return result
+
+        return wrapper  # type: ignore[return-value]
+
+    return decorator
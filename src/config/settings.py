@@ -1,5 +1,6 @@
 from pydantic_settings import BaseSettings
 from pydantic import AliasChoices, Field
+from typing import Any, List, Optional, Tuple, cast
 
 
 class Settings(BaseSettings):
@@ -18,14 +19,226 @@ class Settings(BaseSettings):
     )
     BASE_URL: str = Field(..., validation_alias=AliasChoices("BASE_URL", "base_url"))
 
+    REQUEST_DEADLINE: float = Field(
+        default=25.0,
+        validation_alias=AliasChoices("REQUEST_DEADLINE", "request_deadline"),
+    )
+
+    # Searches running at once across all sessions; further ones queue
+    # (fairly per user) up to ADMISSION_MAX_QUEUED, for at most
+    # ADMISSION_QUEUE_TIMEOUT seconds, and are rejected beyond that.
+    ADMISSION_MAX_RUNNING: int = Field(
+        default=8,
+        validation_alias=AliasChoices("ADMISSION_MAX_RUNNING", "admission_max_running"),
+    )
+    ADMISSION_MAX_QUEUED: int = Field(
+        default=32,
+        validation_alias=AliasChoices("ADMISSION_MAX_QUEUED", "admission_max_queued"),
+    )
+    ADMISSION_QUEUE_TIMEOUT: float = Field(
+        default=20.0,
+        validation_alias=AliasChoices(
+            "ADMISSION_QUEUE_TIMEOUT", "admission_queue_timeout"
+        ),
+    )
+
+    # Comma-separated "region_id:category_id" pairs kept warm by the
+    # background crawler, e.g. "2:2,105:2". Empty disables the crawler.
+    CRAWLER_TARGETS: str = Field(
+        default="", validation_alias=AliasChoices("CRAWLER_TARGETS", "crawler_targets")
+    )
+    CRAWLER_INTERVAL: float = Field(
+        default=300.0,
+        validation_alias=AliasChoices("CRAWLER_INTERVAL", "crawler_interval"),
+    )
+    # ~6KB of vectors per advert; past ANN_INDEX's HNSW threshold (10k)
+    # the store is searched with an HNSW index.
+    WARM_STORE_MAX_ADVERTS: int = Field(
+        default=20000,
+        validation_alias=AliasChoices(
+            "WARM_STORE_MAX_ADVERTS", "warm_store_max_adverts"
+        ),
+    )
+
+    # Worker pools for CPU-bound stages. CPU_THREADS=0 uses one thread per
+    # core; CPU_PROCESSES=0 runs GIL-bound work (cleaning, BM25) on threads.
+    CPU_THREADS: int = Field(
+        default=0, validation_alias=AliasChoices("CPU_THREADS", "cpu_threads")
+    )
+    CPU_PROCESSES: int = Field(
+        default=0, validation_alias=AliasChoices("CPU_PROCESSES", "cpu_processes")
+    )
+    # Threads for blocking calls that wait on the network (embeddings).
+    IO_THREADS: int = Field(
+        default=32, validation_alias=AliasChoices("IO_THREADS", "io_threads")
+    )
+    # Event-loop stalls longer than this (seconds) are logged.
+    LOOP_LAG_WARN: float = Field(
+        default=0.1, validation_alias=AliasChoices("LOOP_LAG_WARN", "loop_lag_warn")
+    )
+    # Service metrics (circuits, admission, hedging, loop lag) are logged
+    # this often (seconds) while the process runs; 0 logs them only at exit.
+    METRICS_INTERVAL: float = Field(
+        default=60.0,
+        validation_alias=AliasChoices("METRICS_INTERVAL", "metrics_interval"),
+    )
+
+    # "auto" picks flat/hnsw/ivf/ivfpq by corpus size (see ann_index.py);
+    # a forced ivf/ivfpq still leaves corpora too small to train on flat.
+    ANN_INDEX: str = Field(
+        default="auto", validation_alias=AliasChoices("ANN_INDEX", "ann_index")
+    )
+    ANN_HNSW_M: int = Field(
+        default=32, validation_alias=AliasChoices("ANN_HNSW_M", "ann_hnsw_m")
+    )
+    ANN_EF_CONSTRUCTION: int = Field(
+        default=80,
+        validation_alias=AliasChoices("ANN_EF_CONSTRUCTION", "ann_ef_construction"),
+    )
+    ANN_EF_SEARCH: int = Field(
+        default=64, validation_alias=AliasChoices("ANN_EF_SEARCH", "ann_ef_search")
+    )
+    ANN_NPROBE: int = Field(
+        default=16, validation_alias=AliasChoices("ANN_NPROBE", "ann_nprobe")
+    )
+    ANN_PQ_SUBQUANTIZERS: int = Field(
+        default=64,
+        validation_alias=AliasChoices("ANN_PQ_SUBQUANTIZERS", "ann_pq_subquantizers"),
+    )
+
+    # "openai" (text-embedding-3-small) or "hashing": local character
+    # n-gram hashing on the CPU, network-free for dev, load tests and
+    # offline runs. With EMBEDDING_FALLBACK, a live search whose OpenAI
+    # embeddings fail is ranked with local ones instead.
+    EMBEDDING_BACKEND: str = Field(
+        default="openai",
+        validation_alias=AliasChoices("EMBEDDING_BACKEND", "embedding_backend"),
+    )
+    EMBEDDING_FALLBACK: bool = Field(
+        default=True,
+        validation_alias=AliasChoices("EMBEDDING_FALLBACK", "embedding_fallback"),
+    )
+    LOCAL_EMBEDDING_DIMENSION: int = Field(
+        default=512,
+        validation_alias=AliasChoices(
+            "LOCAL_EMBEDDING_DIMENSION", "local_embedding_dimension"
+        ),
+    )
+
+    # Embedding requests: documents are cut to EMBEDDING_MAX_TOKENS (adverts
+    # in their description, so title and location stay) and packed into
+    # requests of up to EMBEDDING_BATCH_TOKENS (the API allows 300k), sent
+    # EMBEDDING_CONCURRENCY at a time.
+    EMBEDDING_MAX_TOKENS: int = Field(
+        default=1024,
+        validation_alias=AliasChoices("EMBEDDING_MAX_TOKENS", "embedding_max_tokens"),
+    )
+    EMBEDDING_BATCH_TOKENS: int = Field(
+        default=100_000,
+        validation_alias=AliasChoices(
+            "EMBEDDING_BATCH_TOKENS", "embedding_batch_tokens"
+        ),
+    )
+    EMBEDDING_CONCURRENCY: int = Field(
+        default=4,
+        validation_alias=AliasChoices("EMBEDDING_CONCURRENCY", "embedding_concurrency"),
+    )
+    EMBEDDING_RETRIES: int = Field(
+        default=2,
+        validation_alias=AliasChoices("EMBEDDING_RETRIES", "embedding_retries"),
+    )
+
+    # Pages per region a search with a `target_count` may fetch.
+    FETCH_MAX_PAGES: int = Field(
+        default=8,
+        validation_alias=AliasChoices("FETCH_MAX_PAGES", "fetch_max_pages"),
+    )
+
+    # Share of extra requests allowed for hedging slow enrichment calls
+    # (a duplicate is sent once a call runs past its endpoint's p95).
+    # 0 disables hedging.
+    HEDGE_BUDGET: float = Field(
+        default=0.05, validation_alias=AliasChoices("HEDGE_BUDGET", "hedge_budget")
+    )
+
+    # Per-upstream circuit breakers (OpenAI, Jina, Krisha): open when, over
+    # the last BREAKER_WINDOW seconds and at least BREAKER_MIN_CALLS calls,
+    # the error or slow-call rate reaches its limit; retried after
+    # BREAKER_COOLDOWN seconds.
+    BREAKER_WINDOW: float = Field(
+        default=30.0, validation_alias=AliasChoices("BREAKER_WINDOW", "breaker_window")
+    )
+    BREAKER_MIN_CALLS: int = Field(
+        default=10,
+        validation_alias=AliasChoices("BREAKER_MIN_CALLS", "breaker_min_calls"),
+    )
+    BREAKER_ERROR_RATE: float = Field(
+        default=0.5,
+        validation_alias=AliasChoices("BREAKER_ERROR_RATE", "breaker_error_rate"),
+    )
+    BREAKER_SLOW_RATE: float = Field(
+        default=0.8,
+        validation_alias=AliasChoices("BREAKER_SLOW_RATE", "breaker_slow_rate"),
+    )
+    BREAKER_COOLDOWN: float = Field(
+        default=15.0,
+        validation_alias=AliasChoices("BREAKER_COOLDOWN", "breaker_cooldown"),
+    )
+
+    # Final reranker: "jina" (cross-encoder API) or "llm" (gpt-4o-mini
+    # scoring chunks of candidates concurrently; slower, but weighs the
+    # query's constraints).
+    RERANKER: str = Field(
+        default="jina", validation_alias=AliasChoices("RERANKER", "reranker")
+    )
+    # Documents sent to the reranker are cut to this many tokens (adverts in
+    # their description, so title and location stay).
+    RERANK_MAX_TOKENS: int = Field(
+        default=512,
+        validation_alias=AliasChoices("RERANK_MAX_TOKENS", "rerank_max_tokens"),
+    )
+
     LOG_LEVEL: str = Field(
         default="INFO", validation_alias=AliasChoices("LOG_LEVEL", "log_level")
     )
 
+    @property
+    def crawler_targets(self) -> List[Tuple[str, str]]:
+        pairs = []
+        for target in self.CRAWLER_TARGETS.split(","):
+            if ":" in target:
+                region_id, category_id = target.split(":", 1)
+                pairs.append((region_id.strip(), category_id.strip()))
+        return pairs
+
     class Config:
         env_file = ".env"
         env_file_encoding = "utf-8"
         extra = "ignore"
 
 
-settings = Settings()  # type: ignore[call-arg]
+class LazySettings:
+    """
+    Reads and validates `Settings` on first use rather than at import, so
+    entry points can start (and fail on a missing key) only once they need
+    configuration.
+    """
+
+    def __init__(self):
+        object.__setattr__(self, "_settings", None)
+
+    def _load(self) -> Settings:
+        loaded: Optional[Settings] = object.__getattribute__(self, "_settings")
+        if loaded is None:
+            loaded = Settings()  # type: ignore[call-arg]
+            object.__setattr__(self, "_settings", loaded)
+        return loaded
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self._load(), name)
+
+    def __setattr__(self, name: str, value: Any):
+        setattr(self._load(), name, value)
+
+
+settings = cast(Settings, LazySettings())
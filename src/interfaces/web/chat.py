@@ -1,13 +1,9 @@
 import chainlit as cl
-from price_parser import Price
-import asyncio
 from src.config.cache import cache
 from src.utils.logger import setup_logger
-from src.services.llm_service import QueryParser
-from src.services.api_client import KrishaClient
-from src.services.vector_store import VectorEngine
-from src.services.reranker import JinaReranker
-from src.models import Advert, SearchQuery
+from src.services.container import get_services
+from src.services.pipeline import SearchPipeline
+from src.models import SearchQuery
 
 
 @cl.set_starters
@@ -36,23 +32,65 @@ async def set_starters():
     ]
 
 
-@cl.on_chat_start
-async def start():
+@cl.on_app_startup
+async def startup():
     setup_logger()
     try:
         cache.setup("mem://")
     except Exception:
         pass
+    await get_services().start()
+
+
+@cl.on_app_shutdown
+async def shutdown():
+    await get_services().stop()
+
+
+def get_pipeline() -> SearchPipeline:
+    pipeline = cl.user_session.get("pipeline")
+    if pipeline is None:
+        # Queued per signed-in user when there is one, else per session.
+        user = cl.user_session.get("user")
+        pipeline = get_services().pipeline(
+            top_k_rerank=10,
+            user=user.identifier if user else cl.user_session.get("id"),
+        )
+        cl.user_session.set("pipeline", pipeline)
+    return pipeline
+
+
+@cl.on_chat_end
+async def end_chat():
+    # A pending prefetch holds a running slot until it is used or dropped.
+    pipeline = cl.user_session.get("pipeline")
+    if pipeline is not None:
+        await pipeline.cancel()
+
+
+def chainlit_step(name: str, kind: str) -> cl.Step:
+    return cl.Step(name=name, type=kind)
 
 
 @cl.on_message
 async def main(message: cl.Message):
     user_input = message.content
+    pipeline = get_pipeline()
+    await pipeline.cancel()
     async with cl.Step(name="Parsing", type="llm") as step:
-        parser = QueryParser()
-        params = await parser.parse_user_prompt(user_input)
+        try:
+            params = await get_services().parser.parse_streaming(
+                user_input,
+                on_filters=pipeline.prefetch,
+                previous=cl.user_session.get("search_params"),
+            )
+        except BaseException:
+            # The prefetch started from the hard filters holds an admission
+            # slot and keeps fetching until it is dropped.
+            await pipeline.cancel()
+            raise
         payload_details = [
-            f"Region: {params.region_id}",
+            f"Region: {', '.join(params.region_ids)}",
             f"Category: {params.category_id}",
         ]
         if params.room_count:
@@ -61,6 +99,8 @@ async def main(message: cl.Message):
             payload_details.append(f"Min Price: {params.price_from}")
         if params.price_to:
             payload_details.append(f"Max Price: {params.price_to}")
+        if params.target_count:
+            payload_details.append(f"Target: {params.target_count} listings")
         payload_str = " | ".join(payload_details)
         infra_log = ""
         if params.infrastructure_filters:
@@ -78,76 +118,53 @@ async def main(message: cl.Message):
 
 async def process_search_workflow(params: SearchQuery, user_input: str):
     """
-    Reusable workflow for fetching, enriching, vectorizing, and reranking.
+    Runs the session's search pipeline and renders the results.
     Used by both the initial search and the 'Load More' pagination.
     """
-    results = []
-    raw_listings_count = 0
     step_name = f"Search Batch (Offset: {params.offset})"
-    async with cl.Step(name=step_name, type="run") as root_step:
-        async with cl.Step(name="Fetching", type="tool") as step:
-            client = KrishaClient()
-            raw_listings = await client.fetch_listings(params)
-            raw_listings_count = len(raw_listings)
-            if not raw_listings:
-                step.output = "❌ No listings found in this batch."
-                await cl.Message(
-                    content=f"No results found for offset {params.offset}."
-                ).send()
-                return
-            step.output = f"Found {raw_listings_count} items (Offset: {params.offset})."
-        async with cl.Step(name="Enriching", type="tool") as step:
-            enrich_tasks = [
-                client.enrich_advert_data(
-                    i["id"],
-                    params.infrastructure_filters,
-                    params.infrastructure_operator,
-                )
-                for i in raw_listings
-            ]
-            enriched_results = await asyncio.gather(*enrich_tasks)
-            enriched_map = {d["id"]: d for d in enriched_results}
-            adverts = []
-            dropped_count = 0
-            for item in raw_listings:
-                extra = enriched_map.get(item["id"], {})
-                desc = extra.get("original_text", "")
-                infra = extra.get("infrastructure", "")
-                if params.infrastructure_filters and not infra:
-                    dropped_count += 1
-                    continue
-                full_text = f"Description: {desc}\nTitle: {item.get('title')} Geolocation: {item.get('geoLocation', {}).get('district', '')} {item.get('geoLocation', {}).get('addressTitle', '')}"
-                price_val = str(item.get("price") or item.get("priceTitle", "0"))
-                clean_price = int(Price.fromstring(price_val).amount or 0)
-                adverts.append(
-                    Advert(
-                        id=item["id"],
-                        title=item.get("title", ""),
-                        price=clean_price,
-                        address=item.get("geoLocation", {}).get("addressTitle", ""),
-                        description=desc,
-                        url=f"https://krisha.kz/a/show/{item['id']}",
-                        full_text_content=full_text,
-                    )
-                )
-            step.output = f"Enriched {len(adverts)} items. (Dropped {dropped_count} by Hard Filter)"
-        if adverts:
-            async with cl.Step(name="Retrieval", type="retrieval") as step:
-                engine = VectorEngine()
-                engine.index_data(adverts)
-                candidates = engine.search(params.semantic_query, top_k=50)
-                step.output = (
-                    f"Retrieved {len(candidates)} candidates via Semantic Search."
-                )
-            if candidates:
-                async with cl.Step(name="Reranking", type="llm") as step:
-                    reranker = JinaReranker()
-                    results = await reranker.rerank(user_input, candidates, top_k=10)
-                    step.output = f"Top {len(results)} selected."
+    queue_message = cl.Message(content="")
+    queue_shown = False
+
+    async def show_queue_position(position: int):
+        nonlocal queue_shown
+        queue_message.content = (
+            f"⏳ Many searches are running; you are #{position} in line."
+        )
+        if queue_shown:
+            await queue_message.update()
         else:
-            root_step.output = "No items in this batch matched the hard filters."
+            await queue_message.send()
+            queue_shown = True
 
-        root_step.output = f"✅ Processed {len(results)} results"
+    async with cl.Step(name=step_name, type="run") as root_step:
+        outcome = await get_pipeline().run(
+            params,
+            user_input,
+            report=chainlit_step,
+            on_queued=show_queue_position,
+        )
+        if queue_shown:
+            await queue_message.remove()
+        if outcome.cancelled:
+            root_step.output = "⏹️ Superseded by a newer search."
+            return
+        if outcome.rejected:
+            root_step.output = "🚦 Rejected: the service is at capacity."
+            await cl.Message(
+                "The service is busy right now. Please try again in a minute."
+            ).send()
+            return
+        if outcome.fetched and not outcome.kept:
+            root_step.output = "No items in this batch matched the hard filters."
+        else:
+            root_step.output = f"✅ Processed {len(outcome.results)} results"
+    if outcome.degradations:
+        notes = "\n".join(f"- {d}" for d in outcome.degradations)
+        await cl.Message(content=f"⚠️ Degraded response:\n{notes}").send()
+    if not outcome.fetched:
+        await cl.Message(content=f"No results found for offset {params.offset}.").send()
+        return
+    results = outcome.results
     if not results:
         await cl.Message("No relevant matches found in this batch.").send()
     else:
@@ -158,22 +175,24 @@ async def process_search_workflow(params: SearchQuery, user_input: str):
 **{price_fmt} ₸**  |  📍 {ad.address}  |  ⭐ {ad.rag_score:.2f}
 {ad.description[:200]}...
 """
+            if ad.duplicate_ids:
+                msg_content += f"\n_+{len(ad.duplicate_ids)} similar listings_\n"
             await cl.Message(content=msg_content).send()
-    if raw_listings_count > 0:
-        actions = [
-            cl.Action(
-                name="load_more",
-                value="next_page",
-                label="Load Next 256 Listings",
-                payload={"offset": params.offset},
-            )
-        ]
-        prompt_text = (
-            "Check the next batch?"
-            if not results
-            else "Not what you're looking for? Check the next batch."
+    next_count = params.target_count or params.limit * len(params.region_ids)
+    actions = [
+        cl.Action(
+            name="load_more",
+            value="next_page",
+            label=f"Load Next {next_count} Listings",
+            payload={"offset": params.offset, "offsets": outcome.offsets},
         )
-        await cl.Message(content=prompt_text, actions=actions).send()
+    ]
+    prompt_text = (
+        "Check the next batch?"
+        if not results
+        else "Not what you're looking for? Check the next batch."
+    )
+    await cl.Message(content=prompt_text, actions=actions).send()
 
 
 @cl.action_callback("load_more")
@@ -184,7 +203,14 @@ async def on_load_more(action: cl.Action):
     if not params or not user_query:
         await cl.Message("Session expired. Please start a new search.").send()
         return
-    params.offset += params.limit
+    # Regions may have been read to different depths (several pages each
+    # with `target_count`); each continues after its last page read.
+    offsets = action.payload.get("offsets")
+    if offsets:
+        params.region_offsets = offsets
+        params.offset = min(offsets.values())
+    else:
+        params.offset += params.limit
     cl.user_session.set("search_params", params)
     await cl.Message(
         content=f"🔄 Loading listings {params.offset} - {params.offset + params.limit}..."
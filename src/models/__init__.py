@@ -1,4 +1,24 @@
 from .advert import Advert
+from .api import (
+    AdvertShow,
+    InfrastructureResponse,
+    Listing,
+    Place,
+    PlaceRecord,
+    SearchResponse,
+)
+from .batch import AdvertBatch
 from .search import SearchQuery, InfrastructureFilter
 
-__all__ = ["Advert", "SearchQuery", "InfrastructureFilter"]
+__all__ = [
+    "Advert",
+    "AdvertBatch",
+    "AdvertShow",
+    "InfrastructureResponse",
+    "Listing",
+    "Place",
+    "PlaceRecord",
+    "SearchResponse",
+    "SearchQuery",
+    "InfrastructureFilter",
+]
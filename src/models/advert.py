@@ -14,3 +14,5 @@ class Advert(BaseModel):
     photos: List[str] = []
     full_text_content: str = ""
     rag_score: float = 0.0
+    # IDs of duplicate postings collapsed into this one.
+    duplicate_ids: List[int] = []
@@ -0,0 +1,76 @@
+"""
+Slim schemas of the Krisha.kz API responses.
+
+Only the fields the pipeline reads are declared. Decoding with
+`model_validate_json` parses the raw response bytes in pydantic-core, and every
+undeclared field is skipped without ever becoming a Python object.
+"""
+
+from pydantic import BaseModel, BeforeValidator, ConfigDict, Field
+from typing import Annotated, List, NamedTuple, Optional, Union
+
+# The API sends `null` for missing strings.
+NullableStr = Annotated[str, BeforeValidator(lambda v: "" if v is None else v)]
+
+
+class ApiModel(BaseModel):
+    model_config = ConfigDict(populate_by_name=True)
+
+
+class GeoLocation(ApiModel):
+    address_title: NullableStr = Field("", alias="addressTitle")
+    district: NullableStr = ""
+
+
+class Listing(ApiModel):
+    """
+    Advert model of a search item. Every field is optional because
+    non-advert items (filtered out by `kind`) share the same envelope.
+    """
+
+    id: int = 0
+    title: NullableStr = ""
+    price: Union[int, float, str, None] = None
+    price_title: Optional[str] = Field(None, alias="priceTitle")
+    geo_location: Optional[GeoLocation] = Field(None, alias="geoLocation")
+
+    @property
+    def geo(self) -> GeoLocation:
+        return self.geo_location or GeoLocation.model_validate({})
+
+
+class SearchItem(ApiModel):
+    kind: NullableStr = ""
+    model: Optional[Listing] = None
+
+
+class SearchResponse(ApiModel):
+    items: List[SearchItem] = []
+
+
+class AdvertShow(ApiModel):
+    text: NullableStr = ""
+
+
+class Place(ApiModel):
+    category: NullableStr = ""
+    name: NullableStr = ""
+    title: NullableStr = ""
+    distance: Union[str, int, float, None] = None
+
+
+class PlaceRecord(NamedTuple):
+    """Compact form of a `Place`, as kept in the cache."""
+
+    category: str
+    name: str
+    title: str
+    distance: str
+
+
+class InfrastructureSection(ApiModel):
+    places: List[Place] = []
+
+
+class InfrastructureResponse(ApiModel):
+    data: List[InfrastructureSection] = []
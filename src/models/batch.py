@@ -0,0 +1,147 @@
+from itertools import chain
+from typing import TYPE_CHECKING, Iterable, Iterator, List, Optional, Sequence, Tuple
+from src.utils.lazy import lazy_import
+from src.utils.text_processing import estimate_tokens, truncate_tokens
+from .advert import Advert
+
+if TYPE_CHECKING:
+    import numpy as np
+else:
+    np = lazy_import("numpy")
+
+ADVERT_URL = "https://krisha.kz/a/show/{id}"
+
+# (id, price, rooms, title, address, district, description)
+AdvertRow = Tuple[int, int, int, str, str, str, str]
+
+
+class AdvertBatch:
+    """
+    Compact, columnar view of the adverts handled by one search request.
+
+    IDs, prices and room counts live in NumPy arrays, and all text fields
+    share a single string buffer addressed by offsets. Hundreds of listings then
+    cost a handful of objects instead of a Pydantic model (plus its dicts and
+    lists) each.
+    `Advert` models are materialized only for the rows shown to the user.
+    """
+
+    FIELDS = ("title", "address", "district", "description")
+    __slots__ = ("ids", "prices", "rooms", "_text", "_offsets")
+
+    def __init__(
+        self,
+        ids: "np.ndarray",
+        prices: "np.ndarray",
+        rooms: "np.ndarray",
+        text: str,
+        offsets: "np.ndarray",
+    ):
+        self.ids = ids
+        self.prices = prices
+        self.rooms = rooms
+        self._text = text
+        self._offsets = offsets
+
+    @classmethod
+    def from_rows(cls, rows: Iterable[AdvertRow]) -> "AdvertBatch":
+        ids, prices, rooms, parts, offsets = [], [], [], [], [0]
+        position = 0
+        for advert_id, price, room_count, *fields in rows:
+            ids.append(advert_id)
+            prices.append(price)
+            rooms.append(room_count)
+            for value in fields:
+                parts.append(value)
+                position += len(value)
+                offsets.append(position)
+        return cls(
+            np.array(ids, dtype=np.int64),
+            np.array(prices, dtype=np.int64),
+            np.array(rooms, dtype=np.int8),
+            "".join(parts),
+            np.array(offsets, dtype=np.int64),
+        )
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def _field(self, row: int, field: int) -> str:
+        pos = row * len(self.FIELDS) + field
+        return self._text[int(self._offsets[pos]) : int(self._offsets[pos + 1])]
+
+    def title(self, row: int) -> str:
+        return self._field(row, 0)
+
+    def address(self, row: int) -> str:
+        return self._field(row, 1)
+
+    def district(self, row: int) -> str:
+        return self._field(row, 2)
+
+    def description(self, row: int) -> str:
+        return self._field(row, 3)
+
+    def full_text(self, row: int, max_tokens: Optional[int] = None) -> str:
+        """
+        Text used for embeddings, BM25 and reranking. With `max_tokens`,
+        only the description is cut to fit, so the title and location of
+        a long listing are kept.
+        """
+        head = "Description: "
+        tail = (
+            f"\nTitle: {self.title(row)} "
+            f"Geolocation: {self.district(row)} {self.address(row)}"
+        )
+        description = self.description(row)
+        if max_tokens is not None:
+            description = truncate_tokens(
+                description, max(1, max_tokens - estimate_tokens(head + tail))
+            )
+        return head + description + tail
+
+    def full_texts(self, max_tokens: Optional[int] = None) -> Iterator[str]:
+        return (self.full_text(row, max_tokens) for row in range(len(self)))
+
+    def row(self, row: int) -> AdvertRow:
+        return (
+            int(self.ids[row]),
+            int(self.prices[row]),
+            int(self.rooms[row]),
+            self.title(row),
+            self.address(row),
+            self.district(row),
+            self.description(row),
+        )
+
+    def take(self, rows: Sequence[int]) -> "AdvertBatch":
+        """Returns a new batch holding only the given rows, in that order."""
+        return AdvertBatch.from_rows(self.row(r) for r in rows)
+
+    def concat(self, other: "AdvertBatch") -> "AdvertBatch":
+        """Returns a new batch with the rows of `other` appended."""
+        return AdvertBatch.from_rows(
+            chain(
+                (self.row(r) for r in range(len(self))),
+                (other.row(r) for r in range(len(other))),
+            )
+        )
+
+    def to_advert(
+        self,
+        row: int,
+        rag_score: float = 0.0,
+        duplicate_ids: Optional[List[int]] = None,
+    ) -> Advert:
+        advert_id = int(self.ids[row])
+        return Advert(
+            id=advert_id,
+            title=self.title(row),
+            price=int(self.prices[row]),
+            address=self.address(row),
+            description=self.description(row),
+            url=ADVERT_URL.format(id=advert_id),
+            full_text_content=self.full_text(row),
+            rag_score=rag_score,
+            duplicate_ids=duplicate_ids or [],
+        )
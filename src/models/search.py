@@ -1,5 +1,6 @@
 from pydantic import BaseModel, Field
-from typing import List, Literal, Optional
+from pydantic.json_schema import SkipJsonSchema
+from typing import Any, Dict, List, Literal, Optional, Tuple
 
 
 class InfrastructureFilter(BaseModel):
@@ -19,15 +20,35 @@ class InfrastructureFilter(BaseModel):
 class SearchQuery(BaseModel):
     """Structured output from LLM representing API parameters."""
 
+    refines_previous: bool = Field(
+        default=False,
+        description="True only when a previous search is given and the message narrows it "
+        "(e.g. 'cheaper', 'only 2 rooms', 'with a balcony'). "
+        "False for a new or unrelated search.",
+    )
     region_id: str = Field(
         ..., description="The ID of the city/region (e.g., '2' for Almaty)"
     )
+    extra_region_ids: List[str] = Field(
+        default_factory=list,
+        description="IDs of further regions when the user accepts several. "
+        "Example: 'Almaty or Kaskelen' -> region_id '2', extra_region_ids ['172']. "
+        "Empty for a single region.",
+    )
     category_id: str = Field(..., description="Category ID (e.g., '2' for Rent Flat)")
     price_from: Optional[int] = None
     price_to: Optional[int] = None
     room_count: Optional[List[int]] = None
+    target_count: Optional[int] = Field(
+        default=None,
+        description="How many listings to collect when the user asks for a wider pool "
+        "(e.g. 'show me more options' -> 1000). Leave None for a single page.",
+    )
     limit: int = 256
     offset: int = 0
+    # Region -> offset of its next page, for "Load More" after regions were
+    # read to different depths. Set by the app; hidden from the parser.
+    region_offsets: SkipJsonSchema[Dict[str, int]] = Field(default_factory=dict)
     semantic_query: str = Field(
         ...,
         description="The user request STRIPPED of city names, price numbers, room counts, generic property types (apartment, flat), AND infrastructure/landmarks handled by filters. "
@@ -52,3 +73,26 @@ class SearchQuery(BaseModel):
         "'AND' = listing must match ALL filters (e.g., 'возле метро и рядом школа'). "
         "'OR' = listing must match AT LEAST ONE filter (e.g., 'либо возле метро, либо возле остановки').",
     )
+
+    @property
+    def region_ids(self) -> List[str]:
+        """The primary region followed by any extra ones."""
+        return list(dict.fromkeys([self.region_id, *self.extra_region_ids]))
+
+    def region_offset(self, region_id: str) -> int:
+        return self.region_offsets.get(region_id, self.offset)
+
+    @property
+    def fetch_key(self) -> Tuple[Any, ...]:
+        """The fields that determine which listings are fetched."""
+        return (
+            tuple(self.region_ids),
+            self.category_id,
+            self.price_from,
+            self.price_to,
+            tuple(self.room_count or ()),
+            self.target_count,
+            self.limit,
+            self.offset,
+            tuple(sorted(self.region_offsets.items())),
+        )
@@ -0,0 +1,163 @@
+import asyncio
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Awaitable, Callable, Deque, Dict, Optional
+
+PositionCallback = Callable[[int], Awaitable[Any]]
+
+
+class AdmissionRejected(RuntimeError):
+    """The process is at capacity; the search was turned away without running."""
+
+
+class _Waiter:
+    __slots__ = ("user", "granted")
+
+    def __init__(self, user: str):
+        self.user = user
+        self.granted = False
+
+
+class AdmissionController:
+    """
+    Process-wide cap on concurrently running searches.
+
+    At most `max_running` searches run at once; the rest wait in per-user
+    queues served round-robin, so one user's burst cannot starve the others.
+    A search is rejected at once while `max_queued` are already waiting,
+    and after `queue_timeout` seconds in the queue: turning a few away
+    early keeps the admitted ones within their deadlines instead of every
+    session timing out together.
+    """
+
+    def __init__(
+        self, max_running: int = 8, max_queued: int = 32, queue_timeout: float = 30.0
+    ):
+        self.max_running = max_running
+        self.max_queued = max_queued
+        self.queue_timeout = queue_timeout
+        self.running = 0
+        self.admitted = 0
+        self.rejected = 0
+        # Insertion order is the round-robin order; a served user moves to
+        # the back.
+        self._queues: Dict[str, Deque[_Waiter]] = {}
+        self._changed = asyncio.Event()
+
+    @property
+    def queued(self) -> int:
+        return sum(len(queue) for queue in self._queues.values())
+
+    @asynccontextmanager
+    async def slot(
+        self, user: str, on_position: Optional[PositionCallback] = None
+    ) -> AsyncIterator[None]:
+        """
+        Holds a running slot for the body. While queued, `on_position` is
+        called with the 1-based queue position whenever it changes.
+        Raises AdmissionRejected if the queue is full or the wait too long.
+        """
+        await self._acquire(user, on_position)
+        try:
+            yield
+        finally:
+            self.release()
+
+    def try_acquire(self) -> bool:
+        """
+        Takes a running slot only if one is free and nobody is queued; the
+        caller must `release` it. Never queues and is not counted as a
+        rejection when it fails.
+        """
+        if self.running < self.max_running and not self._queues:
+            self.running += 1
+            self.admitted += 1
+            return True
+        return False
+
+    async def _acquire(self, user: str, on_position: Optional[PositionCallback]):
+        if self.try_acquire():
+            return
+        if self.queued >= self.max_queued:
+            self.rejected += 1
+            raise AdmissionRejected(f"{self.queued} searches are already queued")
+
+        waiter = _Waiter(user)
+        self._queues.setdefault(user, deque()).append(waiter)
+        # Round-robin may place it ahead of other users' queued searches.
+        self._notify()
+        reported = 0
+        try:
+            async with asyncio.timeout(self.queue_timeout):
+                while not waiter.granted:
+                    position = self._position(waiter)
+                    if on_position is not None and position != reported:
+                        reported = position
+                        await on_position(position)
+                    changed = self._changed
+                    if not waiter.granted:
+                        await changed.wait()
+        except BaseException as e:
+            if waiter.granted:
+                self.release()
+            else:
+                self._remove(waiter)
+            if isinstance(e, TimeoutError):
+                self.rejected += 1
+                raise AdmissionRejected(
+                    f"Queued for more than {self.queue_timeout:.0f}s"
+                ) from None
+            raise
+
+    def _position(self, waiter: _Waiter) -> int:
+        """Searches admitted before this one, plus one, under round-robin."""
+        own = self._queues[waiter.user]
+        index = own.index(waiter)
+        position = 1
+        before = True
+        for user, queue in self._queues.items():
+            # Every user is served once per round; this waiter goes in
+            # round `index`, after the users ahead of it in that round.
+            position += min(len(queue), index)
+            if user == waiter.user:
+                before = False
+            elif before and len(queue) > index:
+                position += 1
+        return position
+
+    def release(self):
+        self.running -= 1
+        self._grant()
+
+    def _remove(self, waiter: _Waiter):
+        queue = self._queues[waiter.user]
+        queue.remove(waiter)
+        if not queue:
+            del self._queues[waiter.user]
+        self._grant()
+
+    def _grant(self):
+        while self.running < self.max_running and self._queues:
+            user = next(iter(self._queues))
+            queue = self._queues.pop(user)
+            waiter = queue.popleft()
+            if queue:
+                self._queues[user] = queue
+            waiter.granted = True
+            self.running += 1
+            self.admitted += 1
+        self._notify()
+
+    def _notify(self):
+        """Wakes every waiter: granted ones start, the rest re-report."""
+        self._changed.set()
+        self._changed = asyncio.Event()
+
+    @property
+    def stats(self) -> Dict[str, int]:
+        return {
+            "running": self.running,
+            "queued": self.queued,
+            "admitted": self.admitted,
+            "rejected": self.rejected,
+        }
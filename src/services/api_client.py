@@ -1,17 +1,83 @@
 import httpx
 import asyncio
-from typing import List, Dict, Any
-from tenacity import retry, stop_after_attempt, wait_fixed
+from loguru import logger
+from typing import (
+    Any,
+    AsyncIterator,
+    Awaitable,
+    Dict,
+    List,
+    Optional,
+    Set,
+    Tuple,
+)
+from tenacity import (
+    retry,
+    retry_if_not_exception_type,
+    stop_after_attempt,
+    wait_fixed,
+)
 from src.config.settings import settings
-from src.models import SearchQuery, InfrastructureFilter
+from src.models import (
+    AdvertShow,
+    InfrastructureFilter,
+    InfrastructureResponse,
+    Listing,
+    PlaceRecord,
+    SearchQuery,
+    SearchResponse,
+)
+from src.services.breaker import CircuitOpenError, breaker
+from src.services.hedging import Hedger
 from src.services.scraper import DataExtractor
-from src.config.cache import cache
+from src.config.cache import stale_while_revalidate
+from src.utils.compact import RECORD_VERSION, pack_record, unpack_record
+from src.utils.decoding import decode_json
+
+
+def is_none(result: Any) -> bool:
+    return result is None
+
+
+class PageProgress:
+    """Which pages of each region a listing stream has received."""
+
+    def __init__(self, query: SearchQuery):
+        self.limit = query.limit
+        self.starts = {
+            region: query.region_offset(region) for region in query.region_ids
+        }
+        self.received: Dict[str, Set[int]] = {region: set() for region in self.starts}
+
+    def record(self, region: str, page: int):
+        self.received[region].add(page)
+
+    @property
+    def offsets(self) -> Dict[str, int]:
+        """
+        Region -> offset of its next page: past the unbroken run of pages
+        received from its first. A page after a failed one is fetched
+        again rather than the failed one skipped.
+        """
+        offsets = {}
+        for region, received in self.received.items():
+            run = 0
+            while run in received:
+                run += 1
+            offsets[region] = self.starts[region] + run * self.limit
+        return offsets
 
 
 class KrishaClient:
-    def __init__(self):
+    def __init__(self, hedger: Optional[Hedger] = None):
         self.semaphore = asyncio.Semaphore(20)
         self.client = httpx.AsyncClient(http2=True, timeout=30.0)
+        # Pass a shared hedger so every client draws on one hedge budget.
+        self.hedger = hedger or Hedger(settings.HEDGE_BUDGET)
+
+    async def warm_up(self):
+        """Opens the Krisha connection ahead of the first search."""
+        await self.client.head(settings.BASE_URL)
 
     def _build_search_params(self, query: SearchQuery) -> dict:
         params = {
@@ -40,22 +106,167 @@ class KrishaClient:
 
         return params
 
-    @cache(ttl="5m", key="listings:{query}")
-    @retry(stop=stop_after_attempt(3), wait=wait_fixed(2))
-    async def fetch_listings(self, query: SearchQuery) -> List[dict]:
+    async def fetch_listings(
+        self, query: SearchQuery, progress: Optional[PageProgress] = None
+    ) -> List[Listing]:
+        """
+        Listings of every region of the query, deduplicated by ID: one page
+        per region, or with `target_count` as many pages as it takes.
+        """
+        listings: List[Listing] = []
+        async for page in self.stream_listings(query, progress):
+            listings.extend(page)
+        return listings
+
+    async def stream_listings(
+        self, query: SearchQuery, progress: Optional[PageProgress] = None
+    ) -> AsyncIterator[List[Listing]]:
+        """
+        Requests the pages of all regions concurrently and yields each
+        page's new listings (unseen IDs passing the hard filters) in page
+        order: page 0 of every region, then page 1, and so on, so earlier
+        yields are newer listings. A page is held back only until those
+        before it have arrived. With `target_count`, each full page queues
+        the next one of its region (up to FETCH_MAX_PAGES) while the
+        listings collected and the pages in flight fall short of it; once
+        it is reached, pages behind a received one are still awaited and
+        the rest cancelled, so each region is read without gaps. A failed
+        page is skipped unless no page arrived at all. Each region starts
+        at its `region_offset`; `progress` records the pages received, to
+        page on from where the stream stopped.
+        """
+        regions = query.region_ids
+        target = query.target_count
+        ahead = 1
+        if target:
+            ahead = min(
+                settings.FETCH_MAX_PAGES,
+                max(1, -(-target // (query.limit * len(regions)))),
+            )
+
+        pending: Dict[asyncio.Future, Tuple[str, int]] = {}
+        scheduled: Dict[str, int] = {}
+
+        def schedule(region: str):
+            page = scheduled.get(region, 0)
+            scheduled[region] = page + 1
+            page_query = query.model_copy(
+                update={
+                    "region_id": region,
+                    "extra_region_ids": [],
+                    "target_count": None,
+                    "offset": query.region_offset(region) + page * query.limit,
+                    "region_offsets": {},
+                }
+            )
+            pending[asyncio.ensure_future(self.fetch_page(page_query))] = (
+                region,
+                page,
+            )
+
+        for region in regions:
+            for _ in range(ahead):
+                schedule(region)
+
+        def order(region: str, index: int) -> Tuple[int, int]:
+            return index, regions.index(region)
+
+        seen: Set[int] = set()
+        # Region -> highest page index received.
+        furthest: Dict[str, int] = {}
+        # Received pages waiting for earlier ones, by `order`.
+        arrived: Dict[Tuple[int, int], List[Listing]] = {}
+        collected = 0
+        stopping = False
+        error: Optional[Exception] = None
+        try:
+            while pending:
+                done, _ = await asyncio.wait(
+                    pending, return_when=asyncio.FIRST_COMPLETED
+                )
+                for task in done:
+                    region, index = pending.pop(task)
+                    try:
+                        page = task.result()
+                    except Exception as e:
+                        logger.warning(f"Listing page of region {region} failed: {e}")
+                        error = error or e
+                        continue
+                    furthest[region] = max(index, furthest.get(region, -1))
+                    if progress is not None:
+                        progress.record(region, index)
+                    new = []
+                    for listing in page:
+                        if listing.id in seen:
+                            continue
+                        seen.add(listing.id)
+                        if DataExtractor.passes_hard_filters(listing, query):
+                            new.append(listing)
+                    collected += len(new)
+                    arrived[order(region, index)] = new
+                    if not target or stopping:
+                        continue
+                    if collected >= target:
+                        stopping = True
+                    elif (
+                        len(page) == query.limit
+                        and scheduled[region] < settings.FETCH_MAX_PAGES
+                        and collected + len(pending) * query.limit < target
+                    ):
+                        schedule(region)
+                if stopping:
+                    for task, (region, index) in list(pending.items()):
+                        if index > furthest.get(region, -1):
+                            task.cancel()
+                            del pending[task]
+                # Pages are only scheduled behind a received page of their
+                # region, so nothing can be queued ahead of a yielded one.
+                waiting = min((order(*key) for key in pending.values()), default=None)
+                for key in sorted(arrived):
+                    if waiting is not None and key > waiting:
+                        break
+                    new = arrived.pop(key)
+                    if new:
+                        yield new
+        finally:
+            for task in pending:
+                task.cancel()
+        if not seen and error is not None:
+            raise error
+
+    # Popular queries are refreshed before they expire; an expired page is
+    # served for up to 10 more minutes while a fresh one loads. Keyed on
+    # the fetch fields only, so requests differing in their semantic part
+    # share the page.
+    @stale_while_revalidate(
+        key="listings:{query.fetch_key}", ttl="5m", stale_ttl="10m", refresh_hits=3
+    )
+    async def fetch_page(self, query: SearchQuery) -> List[Listing]:
+        """One cached page: `limit` listings of the query's first region at `offset`."""
+        return await self.search_listings(query)
+
+    @retry(
+        stop=stop_after_attempt(3),
+        wait=wait_fixed(2),
+        retry=retry_if_not_exception_type(CircuitOpenError),
+    )
+    async def search_listings(self, query: SearchQuery) -> List[Listing]:
+        """Uncached search, newest first. Used directly by the delta crawler."""
         url = f"{settings.BASE_URL}/v1/a/listing/search"
         params = self._build_search_params(query)
 
-        resp = await self.client.get(url, params=params)
-        resp.raise_for_status()
-        data = resp.json()
-        return [i["model"] for i in data.get("items", []) if i.get("kind") == "advert"]
+        with breaker("krisha").guard():
+            resp = await self.client.get(url, params=params)
+            resp.raise_for_status()
+        data = await decode_json(SearchResponse, resp.content)
+        return [i.model for i in data.items if i.kind == "advert" and i.model]
 
     async def enrich_advert_data(
         self,
         advert_id: int,
         infra_filters: List[InfrastructureFilter],
         infra_operator: str = "AND",
+        details: Optional[Awaitable[Tuple[str, List[PlaceRecord]]]] = None,
     ) -> Dict[str, Any]:
         """
         Enrich advert with description and infrastructure data.
@@ -64,23 +275,98 @@ class KrishaClient:
             advert_id: The advert ID to enrich
             infra_filters: List of InfrastructureFilter objects
             infra_operator: "AND" or "OR" logic for filters
+            details: Already requested `fetch_details` result (e.g. prefetched)
+        """
+        text, places = await (details or self.fetch_details(advert_id))
+        return {
+            "id": advert_id,
+            "original_text": text,
+            "infrastructure": DataExtractor.parse_infrastructure(
+                places, filters=infra_filters, operator=infra_operator
+            ),
+        }
+
+    async def fetch_details(self, advert_id: int) -> Tuple[str, List[PlaceRecord]]:
         """
+        Description text and nearby places of an advert. Parts that could
+        not be fetched are empty.
+        """
+        text, places = await self._load_details(advert_id)
+        return self._unpack_text(text), self._unpack_places(places)
+
+    async def fetch_complete_details(
+        self, advert_id: int
+    ) -> Optional[Tuple[str, List[PlaceRecord]]]:
+        """Like `fetch_details`, but None unless both parts were fetched."""
+        text, places = await self._load_details(advert_id)
+        if text is None or places is None:
+            return None
+        return self._unpack_text(text), self._unpack_places(places)
+
+    async def _load_details(
+        self, advert_id: int
+    ) -> Tuple[Optional[bytes], Optional[bytes]]:
         async with self.semaphore:
-            show_task = self._fetch_raw_show(advert_id)
-            infra_task = self._fetch_raw_infrastructure(advert_id)
+            text, places = await asyncio.gather(
+                self._load_description(advert_id), self._load_places(advert_id)
+            )
+        return text, places
+
+    @staticmethod
+    def _unpack_text(record: Optional[bytes]) -> str:
+        return unpack_record(record) or ""
+
+    @staticmethod
+    def _unpack_places(record: Optional[bytes]) -> List[PlaceRecord]:
+        return [PlaceRecord(*place) for place in unpack_record(record) or []]
 
-            raw_show, raw_infra = await asyncio.gather(show_task, infra_task)
+    # The caches hold compact records (description text, flattened places)
+    # packed with `pack_record` rather than the full decoded responses.
+    # A failed fetch (None) is cached for a minute only, and expired
+    # records are served for a day while they are refreshed.
 
-            return {
-                "id": advert_id,
-                "original_text": DataExtractor.parse_original_text(raw_show),
-                "infrastructure": DataExtractor.parse_infrastructure(
-                    raw_infra, filters=infra_filters, operator=infra_operator
-                ),
-            }
+    @stale_while_revalidate(
+        key=f"show:v{RECORD_VERSION}:{{advert_id}}",
+        ttl="1h",
+        stale_ttl="1d",
+        is_negative=is_none,
+    )
+    async def _load_description(self, advert_id: int) -> Optional[bytes]:
+        show = await self._fetch_raw_show(advert_id)
+        if show is None:
+            return None
+        return pack_record(DataExtractor.parse_original_text(show))
 
-    @cache(ttl="1h")
-    async def _fetch_raw_show(self, advert_id: int) -> Dict:
+    @stale_while_revalidate(
+        key=f"infra:v{RECORD_VERSION}:{{advert_id}}",
+        ttl="1h",
+        stale_ttl="1d",
+        is_negative=is_none,
+    )
+    async def _load_places(self, advert_id: int) -> Optional[bytes]:
+        infra = await self._fetch_raw_infrastructure(advert_id)
+        if infra is None:
+            return None
+        return pack_record(DataExtractor.compact_places(infra))
+
+    async def _get_detail(
+        self, endpoint: str, url: str, params: Dict[str, str]
+    ) -> httpx.Response:
+        """
+        Hedged GET of a per-advert endpoint behind the Krisha breaker; 5xx
+        responses count as failures. Callers fall back to empty data on any
+        error, which is immediate while the circuit is open.
+        """
+        with breaker("krisha").guard():
+            resp = await self.hedger.call(
+                endpoint, lambda: self.client.get(url, params=params)
+            )
+            if resp.status_code >= 500:
+                resp.raise_for_status()
+        return resp
+
+    async def _fetch_raw_show(self, advert_id: int) -> Optional[AdvertShow]:
+        """The advert page, or None if it could not be fetched."""
         url = f"{settings.BASE_URL}/v1/a/show"
         params = {
             "id": str(advert_id),
@@ -88,12 +374,12 @@ class KrishaClient:
             "appKey": settings.KRISHA_APP_KEY,
         }
         try:
-            resp = await self.client.get(url, params=params)
+            resp = await self._get_detail("show", url, params)
             if resp.status_code == 200:
-                return resp.json()
+                return await decode_json(AdvertShow, resp.content)
         except Exception:
             pass
-        return {}
+        return None
 
     async def _fetch_raw_translation(self, advert_id: int) -> Dict:
         url = f"{settings.BASE_URL}/a/translate"
@@ -110,8 +396,10 @@ class KrishaClient:
             pass
         return {}
 
-    @cache(ttl="1h")
-    async def _fetch_raw_infrastructure(self, advert_id: int) -> Dict:
+    async def _fetch_raw_infrastructure(
+        self, advert_id: int
+    ) -> Optional[InfrastructureResponse]:
+        """Nearby places of an advert, or None if they could not be fetched."""
         url = f"{settings.BASE_URL}/infrastructure/getForAdvert"
         params = {
             "advertId": str(advert_id),
@@ -119,9 +407,9 @@ class KrishaClient:
             "appKey": settings.KRISHA_APP_KEY,
         }
         try:
-            resp = await self.client.get(url, params=params)
+            resp = await self._get_detail("infrastructure", url, params)
             if resp.status_code == 200:
-                return resp.json()
+                return await decode_json(InfrastructureResponse, resp.content)
         except Exception:
             pass
-        return {}
+        return None
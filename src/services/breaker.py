@@ -0,0 +1,158 @@
+import httpx
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Deque, Dict, Iterator, Optional, Tuple, Type
+from loguru import logger
+from src.config.settings import settings
+
+CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+
+# Calls slower than this (seconds) count toward the slow-call trigger.
+SLOW_CALL_SECONDS: Dict[str, float] = {
+    "openai-chat": 10.0,
+    "openai-embeddings": 10.0,
+    "jina": 5.0,
+    "krisha": 5.0,
+}
+
+
+class CircuitOpenError(RuntimeError):
+    """The upstream's breaker is open; the call was not attempted."""
+
+
+class CircuitBreaker:
+    """
+    Closed / open / half-open breaker for one upstream.
+
+    Trips when, over the last BREAKER_WINDOW seconds and at least
+    BREAKER_MIN_CALLS calls, the error rate reaches BREAKER_ERROR_RATE or
+    the share of slow calls reaches BREAKER_SLOW_RATE. While open, calls
+    fail at once with CircuitOpenError, so callers drop to their fallbacks
+    instead of waiting out timeouts. After BREAKER_COOLDOWN one trial call
+    is let through: success closes the breaker, failure reopens it.
+
+    Thread-safe: embedding requests run on worker threads.
+    """
+
+    def __init__(self, name: str, slow_call: float):
+        self.name = name
+        self.slow_call = slow_call
+        self.state = CLOSED
+        self.calls: Deque[Tuple[float, bool, bool]] = deque()
+        self.opened_at = 0.0
+        self.rejected = 0
+        self.trips = 0
+        self._trial_running = False
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def guard(self, ignore: Tuple[Type[BaseException], ...] = ()) -> Iterator[None]:
+        """
+        Wraps one upstream call. Exceptions of the `ignore` types (e.g.
+        a rejected input) mean the upstream is healthy and count as
+        successes, as do 4xx responses (e.g. 404 for a delisted advert):
+        only 5xx, timeouts and transport errors count as failures.
+        Cancellation counts as neither.
+        """
+        trial = self._admit()
+        started = time.monotonic()
+        try:
+            yield
+        except ignore:
+            self._record(time.monotonic() - started, False, trial)
+            raise
+        except httpx.HTTPStatusError as e:
+            failed = e.response.status_code >= 500
+            self._record(time.monotonic() - started, failed, trial)
+            raise
+        except Exception:
+            self._record(time.monotonic() - started, True, trial)
+            raise
+        except BaseException:
+            if trial:
+                with self._lock:
+                    self._trial_running = False
+            raise
+        self._record(time.monotonic() - started, False, trial)
+
+    def _admit(self) -> bool:
+        """Raises CircuitOpenError if the call must not go out. True for a trial."""
+        with self._lock:
+            if self.state == CLOSED:
+                return False
+            if (
+                self.state == OPEN
+                and time.monotonic() - self.opened_at >= settings.BREAKER_COOLDOWN
+            ):
+                self._transition(HALF_OPEN)
+            if self.state == HALF_OPEN and not self._trial_running:
+                self._trial_running = True
+                return True
+            self.rejected += 1
+        raise CircuitOpenError(f"{self.name} circuit is open")
+
+    def _record(self, latency: float, failed: bool, trial: bool):
+        now = time.monotonic()
+        slow = latency >= self.slow_call
+        with self._lock:
+            if trial:
+                self._trial_running = False
+                if failed or slow:
+                    self._trip(now)
+                else:
+                    self.calls.clear()
+                    self._transition(CLOSED)
+                return
+            if self.state != CLOSED:
+                return
+            self.calls.append((now, failed, slow))
+            while self.calls and self.calls[0][0] < now - settings.BREAKER_WINDOW:
+                self.calls.popleft()
+            if len(self.calls) < settings.BREAKER_MIN_CALLS:
+                return
+            errors = sum(1 for _, f, _ in self.calls if f) / len(self.calls)
+            slows = sum(1 for _, _, s in self.calls if s) / len(self.calls)
+            if (
+                errors >= settings.BREAKER_ERROR_RATE
+                or slows >= settings.BREAKER_SLOW_RATE
+            ):
+                self._trip(now)
+
+    def _trip(self, now: float):
+        self.opened_at = now
+        self.trips += 1
+        self.calls.clear()
+        self._transition(OPEN)
+
+    def _transition(self, state: str):
+        if state != self.state:
+            logger.warning(f"Circuit {self.name}: {self.state} -> {state}")
+            self.state = state
+
+    @property
+    def stats(self) -> Dict[str, object]:
+        return {"state": self.state, "trips": self.trips, "rejected": self.rejected}
+
+
+_breakers: Dict[str, CircuitBreaker] = {}
+
+
+def breaker(name: str) -> CircuitBreaker:
+    """
+    The process-wide breaker of an upstream ("openai-chat",
+    "openai-embeddings", "jina", "krisha"). OpenAI chat and embeddings
+    trip separately: embeddings fall back to local vectors, query parsing
+    has no fallback and must not fail because embeddings are slow.
+    """
+    found: Optional[CircuitBreaker] = _breakers.get(name)
+    if found is None:
+        found = _breakers.setdefault(
+            name, CircuitBreaker(name, SLOW_CALL_SECONDS.get(name, 10.0))
+        )
+    return found
+
+
+def breaker_stats() -> Dict[str, Dict[str, object]]:
+    return {name: b.stats for name, b in _breakers.items()}
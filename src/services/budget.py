@@ -0,0 +1,41 @@
+import time
+from typing import Dict, Optional
+
+# Share of the request deadline granted to each stage, in pipeline order.
+STAGE_SHARES: Dict[str, float] = {
+    "fetch": 0.2,
+    "enrich": 0.3,
+    "retrieval": 0.3,
+    "rerank": 0.2,
+}
+
+
+class LatencyBudget:
+    """
+    Per-request deadline split into per-stage budgets.
+
+    A stage's budget is its share of the time still remaining, weighed against
+    the stages that have not run yet. Time saved by a fast stage therefore
+    rolls over to the later ones instead of being lost.
+    """
+
+    def __init__(self, total: float, shares: Optional[Dict[str, float]] = None):
+        self.total = total
+        self.shares = shares or STAGE_SHARES
+        self.deadline = time.monotonic() + total
+
+    def remaining(self) -> float:
+        return max(0.0, self.deadline - time.monotonic())
+
+    def expired(self) -> bool:
+        return self.remaining() <= 0
+
+    def for_stage(self, stage: str) -> float:
+        return self.for_stages(stage)
+
+    def for_stages(self, *stages: str) -> float:
+        """Combined budget of consecutive stages run as one step."""
+        order = list(self.shares)
+        pending = order[order.index(stages[0]) :]
+        weight = sum(self.shares[s] for s in pending)
+        return self.remaining() * sum(self.shares[s] for s in stages) / weight
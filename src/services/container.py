@@ -0,0 +1,177 @@
+import asyncio
+import importlib
+import time
+from loguru import logger
+from typing import Any, Dict, Optional
+from src.config.settings import settings
+from src.services.admission import AdmissionController
+from src.services.api_client import KrishaClient
+from src.services.breaker import breaker_stats
+from src.services.crawler import DeltaCrawler
+from src.services.llm_service import QueryParser
+from src.services.pipeline import SearchPipeline
+from src.services.reranker import AsyncLLMReranker, JinaReranker
+from src.services.vector_store import embedding_client, embedding_dimension
+from src.services.warm_store import WarmStore
+from src.utils.executor import (
+    LoopLagMonitor,
+    run_in_thread,
+    run_io,
+    shutdown_pools,
+    warm_up_pools,
+)
+
+# Imported lazily by the modules that use them (see `src.utils.lazy`).
+HEAVY_MODULES = (
+    "numpy",
+    "openai",
+    "instructor",
+    "faiss",
+    "rank_bm25",
+    "cleantext",
+    "ftfy",
+    "price_parser",
+)
+
+# Upper bound on startup delay caused by a slow or unreachable upstream.
+WARM_UP_TIMEOUT = 10.0
+
+
+class Services:
+    """
+    Long-lived service objects shared by every session of the process.
+
+    Clients own connection pools and TLS contexts, so they are built once
+    and reused instead of being rebuilt for every message.
+    """
+
+    def __init__(self):
+        self.parser = QueryParser()
+        self.client = KrishaClient()
+        self.reranker = JinaReranker()
+        self.llm_reranker: Optional[AsyncLLMReranker] = None
+        if settings.RERANKER == "llm":
+            self.llm_reranker = AsyncLLMReranker()
+        self.lag_monitor = LoopLagMonitor()
+        self.admission = AdmissionController(
+            settings.ADMISSION_MAX_RUNNING,
+            settings.ADMISSION_MAX_QUEUED,
+            settings.ADMISSION_QUEUE_TIMEOUT,
+        )
+        self.crawler: Optional[DeltaCrawler] = None
+        if settings.crawler_targets:
+            # Own client: crawl fan-out must not queue behind user searches
+            # on the shared client's semaphore. The hedge budget and p95s
+            # stay global.
+            self.crawler = DeltaCrawler(
+                KrishaClient(self.client.hedger),
+                WarmStore(settings.WARM_STORE_MAX_ADVERTS, embedding_dimension()),
+                settings.crawler_targets,
+                interval=settings.CRAWLER_INTERVAL,
+            )
+        self._started = False
+        self._metrics_task: Optional[asyncio.Task] = None
+
+    def pipeline(self, top_k_rerank: int = 20, user: str = "") -> SearchPipeline:
+        """
+        A new per-session pipeline over the shared clients. Its runs are
+        admitted and queued as `user`'s.
+        """
+        return SearchPipeline(
+            client=self.client,
+            reranker=self.reranker,
+            top_k_rerank=top_k_rerank,
+            crawler=self.crawler,
+            admission=self.admission,
+            user=user,
+            llm_reranker=self.llm_reranker,
+        )
+
+    async def start(self):
+        """Warms up and starts background tasks. Runs once per process."""
+        if self._started:
+            return
+        self._started = True
+        self.lag_monitor.start()
+        if settings.METRICS_INTERVAL > 0:
+            self._metrics_task = asyncio.create_task(self._report_metrics())
+        await self.warm_up()
+        if self.crawler is not None:
+            self.crawler.start()
+
+    async def warm_up(self):
+        """
+        Opens connections to every upstream API and starts the worker pools
+        before the first user arrives. Failures are logged, not raised: a
+        cold connection only costs the first request some latency.
+        """
+        started = time.monotonic()
+        await run_in_thread(load_dependencies)
+        steps = {
+            "worker pools": run_in_thread(warm_up_pools),
+            "parser": self.parser.warm_up(),
+            "krisha": self.client.warm_up(),
+            "reranker": self.reranker.warm_up(),
+        }
+        if settings.EMBEDDING_BACKEND == "openai":
+            steps["embeddings"] = run_io(lambda: embedding_client().models.list())
+        tasks = {name: asyncio.ensure_future(step) for name, step in steps.items()}
+        _, pending = await asyncio.wait(tasks.values(), timeout=WARM_UP_TIMEOUT)
+        for name, task in tasks.items():
+            if task in pending:
+                task.cancel()
+                logger.warning(f"Warm-up of {name} timed out")
+            elif task.exception() is not None:
+                logger.warning(f"Warm-up of {name} failed: {task.exception()}")
+        logger.info(f"Services warmed up in {time.monotonic() - started:.2f}s")
+
+    def metrics(self) -> Dict[str, Any]:
+        """Health of the process: loop lag, admission, hedging, caches, circuits."""
+        return {
+            "loop_lag": self.lag_monitor.stats(),
+            "admission": self.admission.stats,
+            "hedging": self.client.hedger.stats,
+            "rerank_cache_hit_rate": self.reranker.hit_rate,
+            "circuits": breaker_stats(),
+        }
+
+    async def _report_metrics(self):
+        """Logs the metrics periodically, so an incident shows while it lasts."""
+        while True:
+            await asyncio.sleep(settings.METRICS_INTERVAL)
+            logger.info(f"Service metrics: {self.metrics()}")
+
+    async def stop(self):
+        if self._metrics_task is not None:
+            self._metrics_task.cancel()
+            await asyncio.wait({self._metrics_task})
+            self._metrics_task = None
+        logger.info(f"Service metrics: {self.metrics()}")
+        if self.crawler is not None:
+            await self.crawler.stop()
+            await self.crawler.client.client.aclose()
+        await self.lag_monitor.stop()
+        await self.client.client.aclose()
+        await self.reranker.client.aclose()
+        if self.llm_reranker is not None:
+            await self.llm_reranker.openai.close()
+        shutdown_pools()
+
+
+_services: Optional[Services] = None
+
+
+def load_dependencies():
+    """
+    Completes the deferred imports in one go (blocking, so run it in a
+    thread), e.g. while the CLI is waiting for input.
+    """
+    for name in HEAVY_MODULES:
+        getattr(importlib.import_module(name), "__name__")
+
+
+def get_services() -> Services:
+    global _services
+    if _services is None:
+        _services = Services()
+    return _services
@@ -0,0 +1,154 @@
+import asyncio
+from loguru import logger
+from typing import Dict, List, Optional, Set, Tuple
+from src.config.settings import settings
+from src.models import AdvertBatch, Listing, SearchQuery
+from src.services.api_client import KrishaClient
+from src.services.scraper import DataExtractor
+from src.services.vector_store import VectorEngine
+from src.services.warm_store import CorpusKey, WarmStore
+from src.utils.executor import run_cpu, run_io
+from src.utils.text_processing import clean_corpus
+
+# Syncs that retry an advert whose details could not be fetched before it
+# is given up on (e.g. removed since it was listed).
+MAX_DETAIL_ATTEMPTS = 3
+
+
+class DeltaCrawler:
+    """
+    Keeps the warm corpora of hot (region, category) pairs up to date.
+
+    Search results are ordered by `add_date desc`, so a sync pages through
+    them only until it meets an advert that is already known, then enriches
+    and embeds just the new ones.
+
+    Adverts whose details fail are left out of the store, so they are not
+    counted as known, and are retried by the next syncs.
+    """
+
+    def __init__(
+        self,
+        client: KrishaClient,
+        store: WarmStore,
+        targets: List[Tuple[str, str]],
+        interval: float = 300.0,
+        page_size: int = 100,
+        max_pages: int = 10,
+    ):
+        self.client = client
+        self.store = store
+        self.targets = targets
+        self.interval = interval
+        self.page_size = page_size
+        self.max_pages = max_pages
+        self._locks: Dict[CorpusKey, asyncio.Lock] = {}
+        # Adverts whose details failed, with their attempt counts.
+        self._retry: Dict[CorpusKey, Dict[int, Tuple[Listing, int]]] = {}
+        self._task: Optional[asyncio.Task] = None
+
+    def covers(self, params: SearchQuery) -> bool:
+        return (
+            len(params.region_ids) == 1
+            and (params.region_id, params.category_id) in self.targets
+        )
+
+    def start(self):
+        if self._task is None and self.targets:
+            self._task = asyncio.create_task(self._run_forever())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.wait({self._task})
+            self._task = None
+
+    async def _run_forever(self):
+        while True:
+            for region_id, category_id in self.targets:
+                try:
+                    await self.sync(region_id, category_id)
+                except Exception as e:
+                    logger.error(
+                        f"Delta crawl of {region_id}:{category_id} failed: {e}"
+                    )
+            await asyncio.sleep(self.interval)
+
+    async def sync(self, region_id: str, category_id: str) -> int:
+        """Pulls, enriches and embeds adverts added since the last sync."""
+        key = (region_id, category_id)
+        lock = self._locks.setdefault(key, asyncio.Lock())
+        async with lock:
+            known = self.store.snapshot.known_ids(region_id, category_id)
+            retry = self._retry.setdefault(key, {})
+            listings = await self._fetch_new(region_id, category_id, known)
+            fetched = {listing.id for listing in listings}
+            listings += [
+                listing
+                for advert_id, (listing, _) in retry.items()
+                if advert_id not in fetched
+            ]
+            if not listings:
+                return 0
+
+            details = await asyncio.gather(
+                *(
+                    self.client.fetch_complete_details(listing.id)
+                    for listing in listings
+                )
+            )
+            complete = []
+            for listing, detail in zip(listings, details):
+                attempts = retry.pop(listing.id, (listing, 0))[1] + 1
+                if detail is not None:
+                    complete.append((listing, detail))
+                elif attempts < MAX_DETAIL_ATTEMPTS:
+                    retry[listing.id] = (listing, attempts)
+            if len(complete) < len(listings):
+                logger.warning(
+                    f"Warm corpus {region_id}:{category_id}: details of "
+                    f"{len(listings) - len(complete)} adverts failed; left out of the store"
+                )
+            if not complete:
+                return 0
+            listings = [listing for listing, _ in complete]
+            batch = AdvertBatch.from_rows(
+                DataExtractor.to_row(listing, text) for listing, (text, _) in complete
+            )
+            places = [advert_places for _, (_, advert_places) in complete]
+
+            engine = VectorEngine()
+            corpus = await run_cpu(
+                clean_corpus, list(batch.full_texts(settings.EMBEDDING_MAX_TOKENS))
+            )
+            embeddings = await run_io(engine.embed, corpus)
+
+            await self.store.add(
+                region_id, category_id, batch, corpus, embeddings, places
+            )
+            self.store.schedule_reindex()
+            logger.info(
+                f"Warm corpus {region_id}:{category_id}: +{len(listings)} adverts"
+            )
+            return len(listings)
+
+    async def _fetch_new(
+        self, region_id: str, category_id: str, known: Set[int]
+    ) -> List[Listing]:
+        new: List[Listing] = []
+        for page in range(self.max_pages):
+            query = SearchQuery(
+                region_id=region_id,
+                category_id=category_id,
+                semantic_query="",
+                limit=self.page_size,
+                offset=page * self.page_size,
+            )
+            listings = await self.client.search_listings(query)
+            for listing in listings:
+                if listing.id in known:
+                    return new
+                new.append(listing)
+            if len(listings) < self.page_size:
+                break
+        return new
@@ -0,0 +1,156 @@
+import re
+from functools import lru_cache
+from typing import TYPE_CHECKING, Dict, List, Sequence, Tuple
+from src.models import AdvertBatch
+from src.utils.lazy import lazy_import
+
+if TYPE_CHECKING:
+    import numpy as np
+else:
+    np = lazy_import("numpy")
+
+# MinHash signature of 64 permutations, split into 16 LSH bands of 4 rows:
+# pairs above ~0.8 Jaccard similarity share a band with >99% probability.
+NUM_PERMUTATIONS = 64
+LSH_BANDS = 16
+SIMILARITY_THRESHOLD = 0.8
+# Shingles are windows of this many UTF-8 bytes (~5 Cyrillic characters).
+SHINGLE_BYTES = 10
+# Copies must also agree on rooms and on price within this share: agencies
+# post different flats under one templated description.
+PRICE_TOLERANCE = 0.02
+
+_PRIME = 4294967311  # smallest prime above 2**32
+
+NON_WORD_PATTERN = re.compile(r"[\W_]+")
+
+
+def normalize(text: str) -> str:
+    """Lowercases and strips punctuation/whitespace differences."""
+    return NON_WORD_PATTERN.sub(" ", text.lower()).strip()
+
+
+@lru_cache(maxsize=1)
+def _hash_parameters() -> "Tuple[np.ndarray, np.ndarray, np.ndarray]":
+    """Seeded MinHash permutations and shingle weights, drawn on first use."""
+    rng = np.random.default_rng(42)
+    perm_a = rng.integers(1, 2**32, NUM_PERMUTATIONS, dtype=np.uint64)
+    perm_b = rng.integers(0, 2**32, NUM_PERMUTATIONS, dtype=np.uint64)
+    shingle_weights = rng.integers(1, 2**63, SHINGLE_BYTES, dtype=np.uint64)
+    return perm_a, perm_b, shingle_weights
+
+
+def minhash(text: str) -> "np.ndarray":
+    """MinHash signature over the byte shingles of normalized text."""
+    data = np.frombuffer(text.encode("utf-8"), dtype=np.uint8)
+    windows = np.lib.stride_tricks.sliding_window_view(data, SHINGLE_BYTES)
+    perm_a, perm_b, shingle_weights = _hash_parameters()
+    # Wrapping uint64 arithmetic is the hash; keep its top 32 bits.
+    shingles = np.unique((windows.astype(np.uint64) * shingle_weights).sum(axis=1))
+    shingles >>= np.uint64(32)
+    hashed = (perm_a[:, None] * shingles[None, :] + perm_b[:, None]) % np.uint64(_PRIME)
+    return hashed.min(axis=1)
+
+
+def same_unit(price_a: int, rooms_a: int, price_b: int, rooms_b: int) -> bool:
+    """True if two adverts may describe the same flat: same rooms, close prices."""
+    tolerance = PRICE_TOLERANCE * max(price_a, price_b)
+    return rooms_a == rooms_b and abs(price_a - price_b) <= tolerance
+
+
+def duplicate_labels(
+    texts: Sequence[str], prices: Sequence[int], rooms: Sequence[int]
+) -> "np.ndarray":
+    """
+    Clusters adverts whose texts are exact or near duplicates and which
+    agree on price and rooms (`same_unit`).
+    Returns, for every text, the index of the first text of its cluster.
+    """
+    parent = np.arange(len(texts))
+    prices = [int(price) for price in prices]
+    rooms = [int(count) for count in rooms]
+
+    def similar(i: int, j: int) -> bool:
+        return same_unit(prices[i], rooms[i], prices[j], rooms[j])
+
+    def find(i: int) -> int:
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+
+    def union(i: int, j: int):
+        root_i, root_j = find(i), find(j)
+        if root_i != root_j:
+            parent[max(root_i, root_j)] = min(root_i, root_j)
+
+    exact: Dict[str, List[int]] = {}
+    signatures: Dict[int, np.ndarray] = {}
+    for i, text in enumerate(texts):
+        key = normalize(text)
+        if not key:
+            continue
+        copies = exact.setdefault(key, [])
+        original = next((j for j in copies if similar(j, i)), None)
+        if original is not None:
+            union(original, i)
+            continue
+        copies.append(i)
+        if len(key.encode("utf-8")) >= SHINGLE_BYTES:
+            signatures[i] = minhash(key)
+
+    rows = NUM_PERMUTATIONS // LSH_BANDS
+    for band in range(LSH_BANDS):
+        # Bucketed by rooms too: only same-room adverts can merge.
+        buckets: Dict[Tuple[int, bytes], List[int]] = {}
+        for i, signature in signatures.items():
+            band_key = signature[band * rows : (band + 1) * rows].tobytes()
+            members = buckets.setdefault((rooms[i], band_key), [])
+            for j in members:
+                if (
+                    find(j) != find(i)
+                    and similar(j, i)
+                    and np.mean(signatures[j] == signature) >= SIMILARITY_THRESHOLD
+                ):
+                    union(j, i)
+            members.append(i)
+
+    return np.array([find(i) for i in range(len(texts))], dtype=np.int64)
+
+
+def collapse_batch(
+    batch: AdvertBatch, labels: "np.ndarray"
+) -> Tuple[AdvertBatch, Dict[int, List[int]]]:
+    """
+    Keeps one advert per cluster of `duplicate_labels` over the batch's
+    full texts, prices and rooms (the first, i.e. newest). Returns the collapsed batch and,
+    per kept advert ID, the IDs of the copies it stands for.
+    """
+    keep = np.flatnonzero(labels == np.arange(len(labels)))
+    duplicates: Dict[int, List[int]] = {}
+    for row in np.flatnonzero(labels != np.arange(len(labels))):
+        duplicates.setdefault(int(batch.ids[labels[row]]), []).append(
+            int(batch.ids[row])
+        )
+    if not duplicates:
+        return batch, duplicates
+    return batch.take(keep.tolist()), duplicates
+
+
+def collapse_ranked(
+    batch: AdvertBatch, ranked: List[Tuple[int, float]], labels: "np.ndarray"
+) -> Tuple[List[Tuple[int, float]], Dict[int, List[int]]]:
+    """
+    Like `collapse_batch`, for ranked (row, score) candidates of a larger
+    batch, with `labels` over their full texts in rank order: each
+    cluster keeps its best-ranked row.
+    """
+    kept: List[Tuple[int, float]] = []
+    duplicates: Dict[int, List[int]] = {}
+    for position, (row, score) in enumerate(ranked):
+        if labels[position] == position:
+            kept.append((row, score))
+        else:
+            representative = int(batch.ids[ranked[labels[position]][0]])
+            duplicates.setdefault(representative, []).append(int(batch.ids[row]))
+    return kept, duplicates
@@ -0,0 +1,134 @@
+import asyncio
+import time
+from collections import deque
+from typing import Awaitable, Callable, Deque, Dict, Optional, TypeVar
+
+T = TypeVar("T")
+
+# Hedging starts once an endpoint has this many latency samples.
+MIN_SAMPLES = 20
+# Unused hedge allowance carried over, so short bursts can still hedge.
+MAX_BURST = 10.0
+
+
+class LatencyTracker:
+    """Recent latencies of one endpoint and their running p95."""
+
+    def __init__(self, window: int = 500, refresh: int = 20):
+        self.samples: Deque[float] = deque(maxlen=window)
+        self.refresh = refresh
+        self._p95: Optional[float] = None
+        self._since_refresh = 0
+
+    def record(self, latency: float):
+        self.samples.append(latency)
+        self._since_refresh += 1
+        if len(self.samples) >= MIN_SAMPLES and (
+            self._p95 is None or self._since_refresh >= self.refresh
+        ):
+            ordered = sorted(self.samples)
+            self._p95 = ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))]
+            self._since_refresh = 0
+
+    @property
+    def p95(self) -> Optional[float]:
+        """None until enough samples were seen."""
+        return self._p95
+
+
+class Hedger:
+    """
+    Hedged requests: when a call runs past its endpoint's p95, a duplicate
+    is sent and whichever returns first wins, so one straggler does not set
+    the latency of a whole batch.
+
+    Duplicates are capped by a global budget: every call earns `budget`
+    hedges (0.05 = at most 5% extra requests) and each hedge spends one.
+    """
+
+    def __init__(self, budget: float = 0.05):
+        self.budget = budget
+        self.trackers: Dict[str, LatencyTracker] = {}
+        self.requests = 0
+        self.hedges = 0
+        self.hedge_wins = 0
+        self._allowance = 0.0
+
+    async def call(self, endpoint: str, request: Callable[[], Awaitable[T]]) -> T:
+        """
+        Runs `request()` and, past the endpoint's p95, one duplicate of it.
+        The first copy to succeed wins; a copy that fails first waits for
+        the other, so the call raises only when both fail. `request` must
+        be safe to repeat (an idempotent read).
+        """
+        tracker = self.trackers.setdefault(endpoint, LatencyTracker())
+        self.requests += 1
+        self._allowance = min(self._allowance + self.budget, MAX_BURST)
+
+        started = time.monotonic()
+        primary = asyncio.ensure_future(request())
+        delay = tracker.p95
+        if delay is None or self.budget <= 0:
+            return await self._timed(primary, tracker, started)
+
+        try:
+            done, _ = await asyncio.wait({primary}, timeout=delay)
+        except asyncio.CancelledError:
+            primary.cancel()
+            raise
+        if done or self._allowance < 1:
+            return await self._timed(primary, tracker, started)
+
+        self._allowance -= 1
+        self.hedges += 1
+        hedge = asyncio.ensure_future(request())
+        running = {primary, hedge}
+        winner: Optional["asyncio.Future[T]"] = None
+        try:
+            while running and winner is None:
+                done, running = await asyncio.wait(
+                    running, return_when=asyncio.FIRST_COMPLETED
+                )
+                # Prefer the primary when both finish in the same step.
+                for task in sorted(done, key=lambda t: t is not primary):
+                    if not task.cancelled() and task.exception() is None:
+                        winner = task
+                        break
+        finally:
+            # Also runs on cancellation, so neither copy is left running.
+            for task in running:
+                task.cancel()
+        # Timed from the primary's start either way: when the hedge wins,
+        # this is a lower bound on the straggler's latency. Timing the hedge
+        # alone would drop the tail from the samples and let the p95 (and
+        # with it the hedge delay) drift down.
+        tracker.record(time.monotonic() - started)
+        if winner is None:
+            # Both failed: raise the primary's error.
+            return primary.result()
+        if winner is hedge:
+            self.hedge_wins += 1
+        return winner.result()
+
+    @staticmethod
+    async def _timed(
+        task: "asyncio.Future[T]", tracker: LatencyTracker, started: float
+    ) -> T:
+        try:
+            return await task
+        finally:
+            if task.done() and not task.cancelled():
+                tracker.record(time.monotonic() - started)
+
+    @property
+    def stats(self) -> Dict[str, float]:
+        """Requests, hedges sent, hedges that succeeded first, per-endpoint p95s."""
+        stats: Dict[str, float] = {
+            "requests": self.requests,
+            "hedges": self.hedges,
+            "hedge_wins": self.hedge_wins,
+        }
+        for endpoint, tracker in self.trackers.items():
+            if tracker.p95 is not None:
+                stats[f"p95_{endpoint}"] = tracker.p95
+        return stats
@@ -1,17 +1,21 @@
-import instructor
-from openai import AsyncOpenAI
+import hashlib
+from typing import TYPE_CHECKING, Any, Callable, Dict, List, Optional
 from src.models import SearchQuery
 from src.utils.mappings import REGION_MAP, CATEGORY_MAP
 from src.config.cache import cache
+from src.services.breaker import breaker
+from src.utils.lazy import lazy_import
 
+if TYPE_CHECKING:
+    import instructor
+    import openai
+else:
+    instructor = lazy_import("instructor")
+    openai = lazy_import("openai")
 
-class QueryParser:
-    def __init__(self):
-        self.client = instructor.from_openai(AsyncOpenAI())
-
-    @cache(ttl="24h")
-    async def parse_user_prompt(self, user_text: str) -> SearchQuery:
-        system_prompt = f"""
+# Rendered once at import: the prompt is static, and keeping it
+# byte-identical across requests lets OpenAI's prompt caching reuse it.
+SYSTEM_PROMPT = f"""
         You are a search engine for Krisha.kz.
         Your goal is to map the user's request to API parameters AND create a clean semantic search string.
 
@@ -74,11 +78,133 @@ class QueryParser:
         - Extract specific requirements (e.g. ["allow_students", "allow_pets"]).
         """
 
-        return await self.client.chat.completions.create(
-            model="gpt-4o-mini",
-            response_model=SearchQuery,
-            messages=[
-                {"role": "system", "content": system_prompt},
-                {"role": "user", "content": user_text},
-            ],
-        )
+# Appended after the static prompt, so the cached prefix stays shared.
+FOLLOW_UP_PROMPT = """
+        The user's previous search was: {previous}
+        If the new message refines it (e.g. "cheaper", "only 2 rooms", "with a balcony"),
+        set 'refines_previous' and return the previous search with only the
+        requested change applied: "cheaper" lowers 'price_to', extra features
+        extend 'semantic_query', and fields the user does not mention stay as they were.
+        If the message starts an unrelated search, leave 'refines_previous'
+        false and ignore the previous one.
+        """
+
+# Fields that drive the listing search. The model emits fields in schema
+# order, so they are final once it starts writing `semantic_query`.
+HARD_FILTER_FIELDS = (
+    "region_id",
+    "extra_region_ids",
+    "category_id",
+    "price_from",
+    "price_to",
+    "room_count",
+    "target_count",
+    "limit",
+    "offset",
+)
+
+# Left out of the previous search shown to the model.
+PREVIOUS_EXCLUDE = {"refines_previous", "limit", "offset", "region_offsets"}
+
+# Shared by the blocking and the streaming parse.
+PARSE_CACHE_KEY = "parse:{user_text}"
+PARSE_CACHE_TTL = "24h"
+
+
+class QueryParser:
+    def __init__(self):
+        self.openai = openai.AsyncOpenAI()
+        self.client = instructor.from_openai(self.openai)
+
+    async def warm_up(self):
+        """Opens the OpenAI connection ahead of the first parse."""
+        await self.openai.models.list()
+
+    @staticmethod
+    def _messages(
+        user_text: str, previous: Optional[SearchQuery] = None
+    ) -> List[Dict[str, str]]:
+        messages = [{"role": "system", "content": SYSTEM_PROMPT}]
+        if previous is not None:
+            messages.append(
+                {
+                    "role": "system",
+                    "content": FOLLOW_UP_PROMPT.format(
+                        previous=previous.model_dump_json(exclude=PREVIOUS_EXCLUDE)
+                    ),
+                }
+            )
+        messages.append({"role": "user", "content": user_text})
+        return messages
+
+    @cache(ttl=PARSE_CACHE_TTL, key=PARSE_CACHE_KEY)
+    async def parse_user_prompt(self, user_text: str) -> SearchQuery:
+        with breaker("openai-chat").guard():
+            return await self.client.chat.completions.create(
+                model="gpt-4o-mini",
+                response_model=SearchQuery,
+                messages=self._messages(user_text),
+            )
+
+    async def parse_streaming(
+        self,
+        user_text: str,
+        on_filters: Callable[[SearchQuery], Any],
+        previous: Optional[SearchQuery] = None,
+    ) -> SearchQuery:
+        """
+        Streams the parse and calls `on_filters` as soon as the hard filters
+        are final, so the listing fetch can start while the semantic query
+        and infrastructure filters are still being generated. `on_filters`
+        gets a query with an empty `semantic_query`; the full query is
+        returned once parsing completes.
+
+        With the session's `previous` query, the message is parsed as a
+        possible refinement of it.
+        """
+        key = PARSE_CACHE_KEY.format(user_text=user_text)
+        if previous is not None:
+            context = previous.model_dump_json(exclude=PREVIOUS_EXCLUDE)
+            key += ":" + hashlib.blake2b(context.encode(), digest_size=8).hexdigest()
+        cached = await cache.get(key)
+        if cached is not None:
+            on_filters(cached)
+            return cached
+
+        partial = None
+        filters_sent = False
+        with breaker("openai-chat").guard():
+            async for partial in self.client.chat.completions.create_partial(
+                model="gpt-4o-mini",
+                response_model=SearchQuery,
+                messages=self._messages(user_text, previous),
+            ):
+                if (
+                    not filters_sent
+                    and partial.semantic_query is not None
+                    and partial.region_id
+                    and partial.category_id
+                ):
+                    filters_sent = True
+                    hard_filters = {
+                        field: getattr(partial, field)
+                        for field in HARD_FILTER_FIELDS
+                        if getattr(partial, field) is not None
+                    }
+                    on_filters(
+                        SearchQuery.model_validate(
+                            {
+                                **hard_filters,
+                                "refines_previous": bool(partial.refines_previous),
+                                "semantic_query": "",
+                            }
+                        )
+                    )
+
+        if partial is None:
+            raise ValueError("Query parser returned no output")
+        query = SearchQuery.model_validate(partial.model_dump(exclude_none=True))
+        if not filters_sent:
+            on_filters(query)
+        await cache.set(key, query, expire=PARSE_CACHE_TTL)
+        return query
@@ -0,0 +1,56 @@
+from functools import lru_cache
+from typing import TYPE_CHECKING, Dict, List
+from src.services.dedup import normalize
+from src.utils.lazy import lazy_import
+
+if TYPE_CHECKING:
+    import numpy as np
+else:
+    np = lazy_import("numpy")
+
+# Character n-gram lengths. Texts are padded with spaces, so the n-grams
+# also mark word starts and ends, and short words appear whole.
+NGRAM_SIZES = (3, 4, 5)
+
+
+@lru_cache(maxsize=1)
+def _ngram_weights() -> "Dict[int, np.ndarray]":
+    """Seeded hash weights per n-gram length, drawn on first use."""
+    rng = np.random.default_rng(7)
+    return {size: rng.integers(1, 2**63, size, dtype=np.uint64) for size in NGRAM_SIZES}
+
+
+def hashing_embedding(text: str, dimension: int) -> "np.ndarray":
+    """
+    Signed feature hashing of the character n-grams of normalized text,
+    with sublinear counts. Deterministic, so vectors stay comparable
+    across processes and restarts.
+    """
+    padded = f" {normalize(text)} ".encode("utf-32-le")
+    chars = np.frombuffer(padded, dtype=np.uint32).astype(np.uint64)
+    vector = np.zeros(dimension, dtype=np.float64)
+    for size, weights in _ngram_weights().items():
+        if len(chars) < size:
+            continue
+        windows = np.lib.stride_tricks.sliding_window_view(chars, size)
+        # Wrapping uint64 arithmetic is the hash: its top half picks the
+        # bucket, bit 31 the sign.
+        hashes = (windows * weights).sum(axis=1)
+        buckets = (hashes >> np.uint64(32)) % np.uint64(dimension)
+        signs = np.where(hashes & np.uint64(1 << 31), -1.0, 1.0)
+        vector += np.bincount(
+            buckets.astype(np.intp), weights=signs, minlength=dimension
+        )
+    return np.sign(vector) * np.log1p(np.abs(vector))
+
+
+def hashing_embeddings(texts: List[str], dimension: int) -> "np.ndarray":
+    """
+    Local, CPU-only embeddings of `texts` (not normalized). Lexical rather
+    than semantic: close to BM25 in what they match, but usable anywhere
+    the dense index is, with no network access.
+    """
+    embeddings = np.zeros((len(texts), dimension), dtype="float32")
+    for row, text in enumerate(texts):
+        embeddings[row] = hashing_embedding(text, dimension)
+    return embeddings
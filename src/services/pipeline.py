@@ -0,0 +1,924 @@
+import asyncio
+import threading
+import time
+from contextlib import asynccontextmanager, nullcontext
+from typing import (
+    TYPE_CHECKING,
+    Any,
+    AsyncContextManager,
+    AsyncIterator,
+    Callable,
+    Dict,
+    List,
+    Optional,
+    Tuple,
+)
+from loguru import logger
+from pydantic import BaseModel
+from src.config.settings import settings
+from src.models import Advert, AdvertBatch, Listing, SearchQuery
+from src.services.admission import (
+    AdmissionController,
+    AdmissionRejected,
+    PositionCallback,
+)
+from src.services.api_client import KrishaClient, PageProgress
+from src.services.budget import LatencyBudget
+from src.services.crawler import DeltaCrawler
+from src.services.dedup import collapse_batch, collapse_ranked, duplicate_labels
+from src.services.reranker import RERANKERS, AsyncLLMReranker, JinaReranker
+from src.services.scraper import DataExtractor
+from src.services.vector_store import EmbeddingError, VectorEngine, score_bm25
+from src.services.warm_store import WarmSnapshot
+from src.utils.executor import run_cpu, run_in_thread, run_io
+from src.utils.lazy import lazy_import
+from src.utils.text_processing import clean_corpus, clean_text_content
+
+if TYPE_CHECKING:
+    import numpy as np
+else:
+    np = lazy_import("numpy")
+
+StageReporter = Callable[[str, str], AsyncContextManager[Any]]
+
+
+class StageLog:
+    """Stand-in for a UI step: keeps the stage output so it can be logged."""
+
+    def __init__(self, name: str):
+        self.name = name
+        self.output = ""
+
+
+@asynccontextmanager
+async def log_stage(name: str, kind: str) -> AsyncIterator[StageLog]:
+    """Default reporter: writes each stage's output to the log."""
+    stage = StageLog(name)
+    yield stage
+    if stage.output:
+        logger.info(f"[{name}] {stage.output}")
+
+
+class SearchOutcome(BaseModel):
+    results: List[Advert] = []
+    fetched: int = 0
+    kept: int = 0
+    dropped: int = 0
+    collapsed: int = 0
+    cancelled: bool = False
+    # Turned away by admission control; nothing ran.
+    rejected: bool = False
+    # Region -> offset of its next page of results. Empty when the results
+    # did not come from listing pages (the warm store).
+    offsets: Dict[str, int] = {}
+    degradations: List[str] = []
+    # Kept advert ID -> IDs of the duplicate postings collapsed into it.
+    duplicates: Dict[int, List[int]] = {}
+
+
+Found = Tuple[AdvertBatch, List[Tuple[int, float]]]
+
+# Follow-ups are refined locally only while the session's listings are this
+# fresh (seconds); the listing cache serves pages up to the same age.
+SESSION_MAX_AGE = 15 * 60
+
+
+class Prefetch:
+    """
+    Listings (and their details) requested from the hard filters alone,
+    while the rest of the query is still being parsed.
+
+    Under admission control it holds a running slot from the start; the
+    run that uses it keeps the slot, and dropping it frees the slot.
+    """
+
+    def __init__(
+        self,
+        client: KrishaClient,
+        params: SearchQuery,
+        admission: Optional[AdmissionController] = None,
+    ):
+        self.key = params.fetch_key
+        self.details: Dict[int, asyncio.Task] = {}
+        self.progress = PageProgress(params)
+        self.listings = asyncio.create_task(self._fetch(client, params))
+        self._admission = admission
+
+    async def _fetch(self, client: KrishaClient, params: SearchQuery) -> List[Listing]:
+        listings: List[Listing] = []
+        # Details of a page are requested as soon as it arrives.
+        async for page in client.stream_listings(params, self.progress):
+            listings.extend(page)
+            for listing in page:
+                self.details[listing.id] = asyncio.create_task(
+                    client.fetch_details(listing.id)
+                )
+        return listings
+
+    def cancel(self):
+        self.listings.cancel()
+        for task in self.details.values():
+            task.cancel()
+
+    @property
+    def admitted(self) -> bool:
+        return self._admission is not None
+
+    def release(self):
+        """Frees the running slot, if still held."""
+        admission, self._admission = self._admission, None
+        if admission is not None:
+            admission.release()
+
+    def drop(self):
+        self.cancel()
+        self.release()
+
+    @asynccontextmanager
+    async def slot(self) -> AsyncIterator[None]:
+        """Holds the prefetch's running slot for the run that reuses it."""
+        try:
+            yield
+        finally:
+            self.release()
+
+
+class SessionIndex:
+    """
+    The enriched, embedded page of the session's last live search, kept as
+    a single-pair `WarmSnapshot` so follow-ups that only narrow its query
+    are re-filtered and re-ranked without fetching again.
+    """
+
+    def __init__(
+        self,
+        params: SearchQuery,
+        user_input: str,
+        batch: AdvertBatch,
+        corpus: List[str],
+        embeddings: "np.ndarray",
+        duplicates: Dict[int, List[int]],
+        offsets: Dict[str, int],
+    ):
+        count = len(batch)
+        # Copied: the web UI advances the page of its query in place.
+        self.params = params.model_copy(deep=True)
+        self.user_input = user_input
+        self.duplicates = duplicates
+        self.offsets = offsets
+        self.created = time.monotonic()
+        self.snapshot = WarmSnapshot(
+            batch,
+            np.full(count, int(params.region_id), dtype=np.int32),
+            np.full(count, int(params.category_id), dtype=np.int32),
+            # Pages are streamed in page order, newest first.
+            -np.arange(count, dtype=np.float64),
+            corpus,
+            # Places are not kept, hence infrastructure filters must match.
+            [[] for _ in range(count)],
+            embeddings,
+        )
+
+    def covers(self, params: SearchQuery, infrastructure: bool = True) -> bool:
+        """
+        True if `params` asks for a subset of the indexed listings: the same
+        pages of the same regions and category, with a price range and room set inside the
+        indexed ones. Infrastructure filters must be unchanged unless
+        `infrastructure` is False (hard filters alone, as in a prefetch).
+        """
+        indexed = self.params
+        if time.monotonic() - self.created > SESSION_MAX_AGE:
+            return False
+        if (
+            params.region_ids,
+            params.category_id,
+            params.target_count,
+            params.limit,
+            params.offset,
+            params.region_offsets,
+        ) != (
+            indexed.region_ids,
+            indexed.category_id,
+            indexed.target_count,
+            indexed.limit,
+            indexed.offset,
+            indexed.region_offsets,
+        ):
+            return False
+        if indexed.price_from and (params.price_from or 0) < indexed.price_from:
+            return False
+        if indexed.price_to and not (
+            params.price_to and params.price_to <= indexed.price_to
+        ):
+            return False
+        if indexed.room_count and not (
+            params.room_count and set(params.room_count) <= set(indexed.room_count)
+        ):
+            return False
+        return not infrastructure or (
+            params.infrastructure_filters == indexed.infrastructure_filters
+            and params.infrastructure_operator == indexed.infrastructure_operator
+        )
+
+
+class SearchPipeline:
+    """
+    Fetch -> Enrich -> Index -> Search -> Rerank, shared by the CLI and the web UI.
+
+    A pipeline runs one search at a time. Starting a new run cancels the
+    previous one together with its in-flight HTTP requests and embedding batches,
+    so one pipeline should be kept per user session.
+
+    `prefetch` may be called with the hard filters before the full query is
+    parsed; the next run reuses that fetch if its filters still match.
+
+    With a `DeltaCrawler`, first-page queries for its (region, category)
+    pairs are answered from the pre-enriched warm store, and only listings
+    added since the last sync are fetched. Hard filters are applied to the
+    store's columns and the surviving rows are searched in its shared index.
+
+    The last live page is kept as the session's index. A follow-up the
+    parser marked as refining that search ("cheaper", "only 2 rooms", "with
+    a balcony"), and whose filters only narrow it, is filtered and searched
+    there; only its query is embedded. Any other run drops the index.
+
+    With an `AdmissionController`, a run first waits for one of the
+    process-wide running slots, queued fairly against other users' runs;
+    the latency budget starts once it is admitted. A prefetch starts only
+    on a free slot, which the run then keeps, so queued or rejected
+    searches send nothing to Krisha.
+
+    Every run works against a `LatencyBudget`. A stage that overruns its slice
+    degrades instead of stalling the request, and the outcome lists what was
+    degraded.
+    """
+
+    def __init__(
+        self,
+        client: Optional[KrishaClient] = None,
+        reranker: Optional[JinaReranker] = None,
+        top_k_retrieval: int = 50,
+        top_k_rerank: int = 20,
+        deadline: Optional[float] = None,
+        crawler: Optional[DeltaCrawler] = None,
+        admission: Optional[AdmissionController] = None,
+        user: str = "",
+        llm_reranker: Optional[AsyncLLMReranker] = None,
+    ):
+        self.client = client or KrishaClient()
+        self.reranker = reranker or JinaReranker()
+        if settings.RERANKER not in RERANKERS:
+            raise ValueError(f"Unknown reranker: {settings.RERANKER}")
+        # Replaces Jina for the final ranking when RERANKER is "llm".
+        if llm_reranker is None and settings.RERANKER == "llm":
+            llm_reranker = AsyncLLMReranker()
+        self.llm_reranker = llm_reranker
+        self.top_k_retrieval = top_k_retrieval
+        self.top_k_rerank = top_k_rerank
+        self.deadline = deadline or settings.REQUEST_DEADLINE
+        self.crawler = crawler
+        self.admission = admission
+        self.user = user
+        self._run: Optional[asyncio.Task] = None
+        self._prefetch: Optional[Prefetch] = None
+        self._session: Optional[SessionIndex] = None
+
+    @property
+    def running(self) -> bool:
+        return self._run is not None and not self._run.done()
+
+    async def cancel(self) -> None:
+        """
+        Cancels the active run and any pending prefetch, and waits until the
+        run has unwound.
+        """
+        self._drop_prefetch()
+        await self._cancel_run()
+
+    async def _cancel_run(self) -> None:
+        task = self._run
+        if task is None or task.done():
+            return
+        task.cancel()
+        await asyncio.wait({task})
+
+    def prefetch(self, params: SearchQuery):
+        """
+        Starts fetching and enriching listings for the given hard filters.
+        Skipped when the session's index or the warm store will serve the
+        query, and when no running slot is free: a search that has to queue
+        (or may be turned away) fetches only once it is admitted.
+        """
+        self._drop_prefetch()
+        if (
+            params.refines_previous
+            and self._session is not None
+            and self._session.covers(params, infrastructure=False)
+        ):
+            return
+        if (
+            self.crawler is not None
+            and params.offset == 0
+            and self.crawler.covers(params)
+        ):
+            return
+        if self.admission is not None and not self.admission.try_acquire():
+            return
+        self._prefetch = Prefetch(self.client, params, self.admission)
+
+    def _take_prefetch(self, params: SearchQuery) -> Optional[Prefetch]:
+        prefetch, self._prefetch = self._prefetch, None
+        if prefetch is not None and prefetch.key != params.fetch_key:
+            prefetch.drop()
+            return None
+        return prefetch
+
+    def _drop_prefetch(self):
+        if self._prefetch is not None:
+            self._prefetch.drop()
+            self._prefetch = None
+
+    async def run(
+        self,
+        params: SearchQuery,
+        user_input: str,
+        report: StageReporter = log_stage,
+        on_queued: Optional[PositionCallback] = None,
+    ) -> SearchOutcome:
+        """
+        Runs the search, superseding any run already in progress.
+        Returns an outcome with `cancelled=True` if a newer run took over,
+        or `rejected=True` if admission control turned it away.
+        `on_queued` gets the queue position while the run waits for a slot.
+        """
+        await self._cancel_run()
+
+        task = asyncio.create_task(self._execute(params, user_input, report, on_queued))
+        self._run = task
+        try:
+            return await task
+        except asyncio.CancelledError:
+            current = asyncio.current_task()
+            if current is not None and current.cancelling():
+                raise
+            return SearchOutcome(cancelled=True)
+        finally:
+            if self._run is task:
+                self._run = None
+
+    async def _execute(
+        self,
+        params: SearchQuery,
+        user_input: str,
+        report: StageReporter,
+        on_queued: Optional[PositionCallback],
+    ) -> SearchOutcome:
+        cancel_event = threading.Event()
+        prefetch = self._take_prefetch(params)
+        admission: AsyncContextManager[None]
+        if prefetch is not None and prefetch.admitted:
+            admission = prefetch.slot()
+        elif self.admission is not None:
+            admission = self.admission.slot(self.user, on_queued)
+        else:
+            admission = nullcontext()
+        try:
+            async with admission:
+                return await self._stages(
+                    params, user_input, prefetch, report, cancel_event
+                )
+        except AdmissionRejected as e:
+            logger.warning(f"Search rejected: {e}")
+            if prefetch is not None:
+                prefetch.drop()
+            return SearchOutcome(rejected=True)
+        except asyncio.CancelledError:
+            # Worker threads cannot be interrupted, so signal them to stop
+            # at the next batch boundary instead.
+            cancel_event.set()
+            raise
+
+    async def _stages(
+        self,
+        params: SearchQuery,
+        user_input: str,
+        prefetch: Optional[Prefetch],
+        report: StageReporter,
+        cancel_event: threading.Event,
+    ) -> SearchOutcome:
+        outcome = SearchOutcome()
+        budget = LatencyBudget(self.deadline)
+
+        session = self._session
+        rerank_input = user_input
+        try:
+            found = None
+            if (
+                params.refines_previous
+                and session is not None
+                and session.covers(params)
+            ):
+                found = await self._refine(
+                    session, params, report, budget, cancel_event, outcome
+                )
+                # A follow-up alone ("cheaper") says little about relevance.
+                rerank_input = f"{session.user_input} {user_input}"
+            else:
+                # Replaced by this run's page if it is searched live.
+                self._session = None
+                if (
+                    self.crawler is not None
+                    and params.offset == 0
+                    and self.crawler.covers(params)
+                ):
+                    found = await self._search_warm(
+                        params, report, budget, cancel_event, outcome
+                    )
+            if found is None:
+                found = await self._search_live(
+                    params, user_input, prefetch, report, budget, cancel_event, outcome
+                )
+        finally:
+            if prefetch is not None:
+                prefetch.cancel()
+        if found is None:
+            return outcome
+        batch, candidates = found
+
+        if not candidates:
+            return outcome
+
+        async with report("Reranking", "llm") as step:
+            final_rows = await self._rerank(
+                batch,
+                candidates,
+                rerank_input,
+                params.constraints,
+                budget.for_stage("rerank"),
+                outcome,
+            )
+            step.output = f"Top {len(final_rows)} selected."
+
+        outcome.results = [
+            batch.to_advert(row, score, outcome.duplicates.get(int(batch.ids[row]), []))
+            for row, score in final_rows
+        ]
+        return outcome
+
+    async def _search_live(
+        self,
+        params: SearchQuery,
+        user_input: str,
+        prefetch: Optional[Prefetch],
+        report: StageReporter,
+        budget: LatencyBudget,
+        cancel_event: threading.Event,
+        outcome: SearchOutcome,
+    ) -> Optional[Found]:
+        """
+        Fetches and enriches a page of listings, then indexes and searches it.
+        Picks up where a matching prefetch got to. The indexed page becomes
+        the session's index.
+        """
+        async with report("Fetching", "tool") as step:
+            try:
+                progress = (
+                    prefetch.progress if prefetch is not None else PageProgress(params)
+                )
+                fetching = (
+                    prefetch.listings
+                    if prefetch is not None
+                    else self.client.fetch_listings(params, progress)
+                )
+                raw_listings = await asyncio.wait_for(
+                    fetching, budget.for_stage("fetch")
+                )
+            except TimeoutError:
+                outcome.degradations.append("Listing search exceeded its time budget.")
+                step.output = "⏱️ Listing search timed out."
+                return None
+            outcome.fetched = len(raw_listings)
+            outcome.offsets = progress.offsets
+            if not raw_listings:
+                step.output = "❌ No listings found in this batch."
+                return None
+            step.output = f"Found {outcome.fetched} items (Offset: {params.offset})."
+
+        async with report("Enriching", "tool") as step:
+            enriched_map = await self._enrich(
+                raw_listings,
+                params,
+                budget.for_stage("enrich"),
+                outcome,
+                prefetch.details if prefetch is not None else None,
+            )
+            batch, outcome.dropped = self._build_batch(
+                raw_listings, enriched_map, params
+            )
+            del raw_listings, enriched_map
+            # Collapsed before indexing: reposts would otherwise be embedded
+            # again and crowd each other out of the rerank window. Compared
+            # on the full text, price and rooms, so agency boilerplate
+            # shared by different flats is not merged.
+            labels = await run_cpu(
+                duplicate_labels,
+                list(batch.full_texts()),
+                batch.prices.tolist(),
+                batch.rooms.tolist(),
+            )
+            batch, outcome.duplicates = collapse_batch(batch, labels)
+            outcome.kept = len(batch)
+            outcome.collapsed = len(labels) - len(batch)
+            step.output = f"Enriched {outcome.kept} items. (Dropped {outcome.dropped} by Hard Filter, collapsed {outcome.collapsed} duplicates)"
+
+        if not len(batch):
+            return None
+
+        async with report("Retrieval", "retrieval") as step:
+            engine = VectorEngine()
+            candidates = await self._retrieve(
+                engine,
+                batch,
+                params,
+                budget.for_stage("retrieval"),
+                cancel_event,
+                outcome,
+            )
+            step.output = f"Retrieved {len(candidates)} candidates via Semantic Search."
+
+        # A fallback index cannot serve follow-ups: their queries are
+        # embedded with the configured backend.
+        self._session = (
+            SessionIndex(
+                params,
+                user_input,
+                batch,
+                engine.corpus,
+                engine.embeddings,
+                outcome.duplicates,
+                outcome.offsets,
+            )
+            if engine.embeddings is not None and not engine.fell_back
+            else None
+        )
+        return batch, candidates
+
+    async def _refine(
+        self,
+        session: SessionIndex,
+        params: SearchQuery,
+        report: StageReporter,
+        budget: LatencyBudget,
+        cancel_event: threading.Event,
+        outcome: SearchOutcome,
+    ) -> Found:
+        """
+        Answers a follow-up that narrows the session's search from its index:
+        the hard filters become a mask over its columns and the surviving
+        rows are searched like warm ones.
+        """
+        snapshot = session.snapshot
+        async with report("Refining", "tool") as step:
+            rows = np.flatnonzero(snapshot.mask(params))
+            outcome.fetched = len(snapshot)
+            outcome.kept = len(rows)
+            outcome.dropped = outcome.fetched - outcome.kept
+            outcome.duplicates = session.duplicates
+            outcome.offsets = session.offsets
+            outcome.collapsed = sum(len(ids) for ids in session.duplicates.values())
+            step.output = f"Narrowed the previous {outcome.fetched} listings to {outcome.kept}, no refetch."
+
+        if not len(rows):
+            return snapshot.batch, []
+
+        async with report("Retrieval", "retrieval") as step:
+            candidates = await self._retrieve_warm(
+                snapshot,
+                rows,
+                params,
+                budget.for_stage("retrieval"),
+                cancel_event,
+                outcome,
+            )
+            step.output = f"Retrieved {len(candidates)} candidates via Semantic Search."
+
+        return snapshot.batch, candidates
+
+    async def _search_warm(
+        self,
+        params: SearchQuery,
+        report: StageReporter,
+        budget: LatencyBudget,
+        cancel_event: threading.Event,
+        outcome: SearchOutcome,
+    ) -> Optional[Found]:
+        """
+        Serves the query from the crawler's warm store after pulling the
+        listings added since its last sync. Returns None while the pair is
+        still cold, so the caller falls back to a live fetch.
+        """
+        assert self.crawler is not None
+        region_id, category_id = params.region_id, params.category_id
+        async with report("Warm Store", "tool") as step:
+            new_count = 0
+            sync_late = False
+            try:
+                # Shielded: the sync is shared with other sessions and the
+                # background loop, so a timeout here must not abort it.
+                new_count = await asyncio.wait_for(
+                    asyncio.shield(self.crawler.sync(region_id, category_id)),
+                    budget.for_stages("fetch", "enrich"),
+                )
+            except TimeoutError:
+                sync_late = True
+            except Exception as e:
+                logger.error(f"Warm sync failed: {e}")
+
+            snapshot = self.crawler.store.snapshot
+            if not snapshot.known_ids(region_id, category_id):
+                step.output = "Warm corpus not ready, fetching live."
+                return None
+            if sync_late:
+                outcome.degradations.append(
+                    "Newest listings are still syncing; served the warm corpus."
+                )
+
+            rows = await run_in_thread(snapshot.select, params)
+            outcome.fetched = len(snapshot.known_ids(region_id, category_id))
+            outcome.kept = len(rows)
+            outcome.dropped = outcome.fetched - outcome.kept
+            step.output = f"Matched {outcome.kept} of {outcome.fetched} warm listings ({new_count} new)."
+
+        if not len(rows):
+            return snapshot.batch, []
+
+        async with report("Retrieval", "retrieval") as step:
+            candidates = await self._retrieve_warm(
+                snapshot,
+                rows,
+                params,
+                budget.for_stage("retrieval"),
+                cancel_event,
+                outcome,
+            )
+            ranked_rows = [row for row, _ in candidates]
+            labels = await run_cpu(
+                duplicate_labels,
+                [snapshot.batch.full_text(row) for row in ranked_rows],
+                snapshot.batch.prices[ranked_rows].tolist(),
+                snapshot.batch.rooms[ranked_rows].tolist(),
+            )
+            candidates, outcome.duplicates = collapse_ranked(
+                snapshot.batch, candidates, labels
+            )
+            outcome.collapsed = len(labels) - len(candidates)
+            step.output = f"Retrieved {len(candidates)} candidates via Semantic Search ({outcome.collapsed} duplicates collapsed)."
+
+        return snapshot.batch, candidates
+
+    async def _enrich(
+        self,
+        raw_listings: List[Listing],
+        params: SearchQuery,
+        timeout: float,
+        outcome: SearchOutcome,
+        details: Optional[Dict[int, asyncio.Task]] = None,
+    ) -> Dict[int, Dict[str, Any]]:
+        """
+        Enriches listings until the budget expires, keeping whatever arrived.
+        Prefetched `details` tasks are reused instead of refetching.
+        """
+        details = details or {}
+        tasks = [
+            asyncio.create_task(
+                self.client.enrich_advert_data(
+                    i.id,
+                    params.infrastructure_filters,
+                    params.infrastructure_operator,
+                    details.get(i.id),
+                )
+            )
+            for i in raw_listings
+        ]
+        try:
+            done, pending = await asyncio.wait(tasks, timeout=timeout)
+        finally:
+            for task in tasks:
+                task.cancel()
+
+        if pending:
+            outcome.degradations.append(
+                f"Enrichment budget expired: used {len(done)} of {len(tasks)} listings."
+            )
+        completed = (
+            t.result() for t in done if not t.cancelled() and t.exception() is None
+        )
+        return {d["id"]: d for d in completed}
+
+    async def _retrieve(
+        self,
+        engine: VectorEngine,
+        batch: AdvertBatch,
+        params: SearchQuery,
+        timeout: float,
+        cancel_event: threading.Event,
+        outcome: SearchOutcome,
+    ) -> List[Tuple[int, float]]:
+        """
+        Builds the dense and BM25 indexes of `batch` in `engine` concurrently.
+        Falls back to vector-only ranking if BM25 is late, and to the newest
+        listings if the embeddings themselves do not arrive in time.
+        """
+        stage_ends = time.monotonic() + timeout
+        query = params.semantic_query
+        engine.load_corpus(
+            await run_cpu(
+                clean_corpus, list(batch.full_texts(settings.EMBEDDING_MAX_TOKENS))
+            )
+        )
+
+        sparse = asyncio.ensure_future(run_cpu(score_bm25, engine.corpus, query))
+        try:
+            candidate_indices, vector_scores = await asyncio.wait_for(
+                self._dense_search(engine, query, cancel_event),
+                max(0.0, stage_ends - time.monotonic()),
+            )
+        except (TimeoutError, EmbeddingError) as e:
+            cancel_event.set()
+            sparse.cancel()
+            outcome.degradations.append(self._embedding_degradation(e))
+            return [(row, 0.0) for row in range(min(len(batch), self.top_k_retrieval))]
+        if engine.fell_back:
+            outcome.degradations.append(
+                "OpenAI embeddings unavailable; ranked with local keyword embeddings."
+            )
+
+        try:
+            all_bm25_scores = await asyncio.wait_for(
+                sparse, max(0.0, stage_ends - time.monotonic())
+            )
+            bm25_scores = all_bm25_scores[candidate_indices]
+        except TimeoutError:
+            bm25_scores = None
+            outcome.degradations.append(
+                "Keyword (BM25) scoring was late; used vector-only ranking."
+            )
+
+        return engine.fuse(
+            candidate_indices, vector_scores, bm25_scores, self.top_k_retrieval
+        )
+
+    async def _retrieve_warm(
+        self,
+        snapshot: WarmSnapshot,
+        rows: "np.ndarray",
+        params: SearchQuery,
+        timeout: float,
+        cancel_event: threading.Event,
+        outcome: SearchOutcome,
+    ) -> List[Tuple[int, float]]:
+        """
+        Searches the filtered warm rows: only the query is embedded, and
+        FAISS skips every row outside the filter bitmap. Degrades like
+        `_retrieve` when BM25 or the query embedding is late.
+        """
+        stage_ends = time.monotonic() + timeout
+        query = clean_text_content(params.semantic_query)
+        sparse = asyncio.ensure_future(
+            run_in_thread(
+                snapshot.bm25_scores,
+                params.region_id,
+                params.category_id,
+                query.split(" "),
+                rows,
+            )
+        )
+        try:
+            query_embedding = await asyncio.wait_for(
+                run_io(VectorEngine().embed, [query], cancel_event),
+                max(0.0, stage_ends - time.monotonic()),
+            )
+        except (TimeoutError, EmbeddingError) as e:
+            cancel_event.set()
+            sparse.cancel()
+            outcome.degradations.append(self._embedding_degradation(e))
+            newest = rows[np.argsort(-snapshot.added_at[rows], kind="stable")]
+            return [(int(row), 0.0) for row in newest[: self.top_k_retrieval]]
+
+        candidate_rows, vector_scores = await run_in_thread(
+            snapshot.search, query_embedding, rows
+        )
+
+        try:
+            row_scores = await asyncio.wait_for(
+                sparse, max(0.0, stage_ends - time.monotonic())
+            )
+            bm25_scores = row_scores[np.searchsorted(rows, candidate_rows)]
+        except TimeoutError:
+            bm25_scores = None
+            outcome.degradations.append(
+                "Keyword (BM25) scoring was late; used vector-only ranking."
+            )
+
+        return VectorEngine.fuse(
+            candidate_rows, vector_scores, bm25_scores, self.top_k_retrieval
+        )
+
+    async def _rerank(
+        self,
+        batch: AdvertBatch,
+        candidates: List[Tuple[int, float]],
+        user_input: str,
+        constraints: List[str],
+        timeout: float,
+        outcome: SearchOutcome,
+    ) -> List[Tuple[int, float]]:
+        """
+        Reranks candidate rows with Jina (or the LLM reranker), keeping
+        hybrid order on failure.
+        """
+        try:
+            ranked = await asyncio.wait_for(
+                self._rank_candidates(batch, candidates, user_input, constraints),
+                timeout,
+            )
+        except TimeoutError:
+            outcome.degradations.append(
+                "Reranking skipped (time budget exceeded); results are in hybrid search order."
+            )
+            return candidates[: self.top_k_rerank]
+        except Exception as e:
+            logger.error(f"Reranking failed: {e}")
+            outcome.degradations.append(
+                "Reranking failed; results are in hybrid search order."
+            )
+            return candidates[: self.top_k_rerank]
+        return [(candidates[index][0], score) for index, score in ranked]
+
+    async def _rank_candidates(
+        self,
+        batch: AdvertBatch,
+        candidates: List[Tuple[int, float]],
+        user_input: str,
+        constraints: List[str],
+    ) -> List[Tuple[int, float]]:
+        """(candidate position, score) pairs of the top candidates, best first."""
+        if self.llm_reranker is not None:
+            adverts = [batch.to_advert(row) for row, _ in candidates]
+            positions = {ad.id: position for position, ad in enumerate(adverts)}
+            ranked = await self.llm_reranker.rerank(user_input, constraints, adverts)
+            return [
+                (positions[ad.id], ad.rag_score) for ad in ranked[: self.top_k_rerank]
+            ]
+        # Cut here rather than by the reranker, which would cut the title
+        # and location off the end of a long listing.
+        documents = [
+            batch.full_text(row, settings.RERANK_MAX_TOKENS) for row, _ in candidates
+        ]
+        return await self.reranker.rerank_documents(
+            user_input, documents, top_k=self.top_k_rerank
+        )
+
+    @staticmethod
+    def _embedding_degradation(error: Exception) -> str:
+        if isinstance(error, EmbeddingError):
+            logger.error(str(error))
+            return "Semantic search failed (embeddings unavailable); showing newest listings."
+        return "Semantic search skipped (embeddings exceeded the time budget); showing newest listings."
+
+    @staticmethod
+    async def _dense_search(
+        engine: VectorEngine, query: str, cancel_event: threading.Event
+    ) -> Tuple[Any, Any]:
+        """
+        Embedding requests wait on the network, so they run on the I/O
+        pool; indexing and search stay on the CPU pool.
+        """
+        await run_io(engine.embed_corpus, cancel_event)
+        query_embedding = await run_io(engine.embed_query, query)
+        await run_in_thread(engine.index_embeddings)
+        return await run_in_thread(engine.search_embedding, query_embedding)
+
+    @staticmethod
+    def _build_batch(
+        raw_listings: List[Listing],
+        enriched_map: Dict[int, Dict[str, Any]],
+        params: SearchQuery,
+    ) -> Tuple[AdvertBatch, int]:
+        """
+        Merges listings with enrichment, dropping those failing infra filters.
+        Listings whose enrichment did not arrive are skipped.
+        """
+        rows = []
+        dropped_count = 0
+        for item in raw_listings:
+            if item.id not in enriched_map:
+                continue
+            extra = enriched_map[item.id]
+            desc = extra.get("original_text", "")
+            infra = extra.get("infrastructure", "")
+            if params.infrastructure_filters and not infra:
+                dropped_count += 1
+                continue
+            rows.append(DataExtractor.to_row(item, desc))
+        return AdvertBatch.from_rows(rows), dropped_count
@@ -1,12 +1,52 @@
-import instructor
-from openai import OpenAI
+import asyncio
+import bisect
+import hashlib
 from pydantic import BaseModel, Field
-from typing import List
+from typing import (
+    TYPE_CHECKING,
+    AsyncIterator,
+    Awaitable,
+    Callable,
+    List,
+    Optional,
+    Tuple,
+)
 from src.models import Advert
+from src.config.cache import cache
+from src.services.breaker import breaker
 from src.config.settings import settings
+from src.utils.text_processing import truncate_tokens
+from src.utils.lazy import lazy_import
 import httpx
 from loguru import logger
 
+if TYPE_CHECKING:
+    import instructor
+    import openai
+else:
+    instructor = lazy_import("instructor")
+    openai = lazy_import("openai")
+
+
+JINA_RERANK_MODEL = "jina-reranker-v2-base-multilingual"
+RERANKERS = ("jina", "llm")
+# Relevance of a document to a query does not change, only the listing
+# text can; the document hash in the key covers that.
+RERANK_CACHE_TTL = "24h"
+
+
+def rerank_cache_keys(query: str, documents: List[str]) -> List[str]:
+    """Cache keys of (normalized query, document content) pairs."""
+    query_hash = content_hash(" ".join(query.lower().split()))
+    return [
+        f"rerank:{JINA_RERANK_MODEL}:{query_hash}:{content_hash(doc)}"
+        for doc in documents
+    ]
+
+
+def content_hash(text: str) -> str:
+    return hashlib.blake2b(text.encode("utf-8"), digest_size=16).hexdigest()
+
 
 class RankedAdvert(BaseModel):
     id: int
@@ -29,28 +69,26 @@ class RankingResponse(BaseModel):
     ranked_items: List[RankedAdvert]
 
 
-class LLMReranker:
-    def __init__(self):
-        self.client = instructor.from_openai(OpenAI())
+# Listings scoring at or below this (0-10 scale) are dropped.
+LLM_SCORE_THRESHOLD = 2.0
 
-    def rerank(
-        self, query: str, constraints: List[str], adverts: List[Advert]
-    ) -> List[Advert]:
-        if not adverts:
-            return []
 
-        candidates_text = ""
-        for ad in adverts:
-            short_desc = (
-                (ad.description[:400] + "..")
-                if len(ad.description) > 400
-                else ad.description
-            )
-            candidates_text += (
-                f"ID: {ad.id} | Addr: {ad.address} | Desc: {short_desc}\n---\n"
-            )
+def format_candidates(adverts: List[Advert]) -> str:
+    candidates_text = ""
+    for ad in adverts:
+        short_desc = (
+            (ad.description[:400] + "..")
+            if len(ad.description) > 400
+            else ad.description
+        )
+        candidates_text += (
+            f"ID: {ad.id} | Addr: {ad.address} | Desc: {short_desc}\n---\n"
+        )
+    return candidates_text
 
-        system_prompt = f"""
+
+def scoring_prompt(query: str, constraints: List[str]) -> str:
+    return f"""
         You are a Real Estate Scoring Engine.
 
         User Query: "{query}"
@@ -65,13 +103,29 @@ class LLMReranker:
            - 1 = Allows it OR is silent/neutral.
         """
 
+
+def final_score(item: RankedAdvert) -> float:
+    weighted_score = (item.location_score * 0.6) + (item.quality_score * 0.4)
+    return float(weighted_score * item.constraints_score)
+
+
+class LLMReranker:
+    def __init__(self):
+        self.client = instructor.from_openai(openai.OpenAI())
+
+    def rerank(
+        self, query: str, constraints: List[str], adverts: List[Advert]
+    ) -> List[Advert]:
+        if not adverts:
+            return []
+
         try:
             response = self.client.chat.completions.create(
                 model="gpt-4o-mini",
                 response_model=RankingResponse,
                 messages=[
-                    {"role": "system", "content": system_prompt},
-                    {"role": "user", "content": candidates_text},
+                    {"role": "system", "content": scoring_prompt(query, constraints)},
+                    {"role": "user", "content": format_candidates(adverts)},
                 ],
             )
 
@@ -82,14 +136,10 @@ class LLMReranker:
                 if item.id not in ad_map:
                     continue
 
-                weighted_score = (item.location_score * 0.6) + (
-                    item.quality_score * 0.4
-                )
-                final_score = weighted_score * item.constraints_score
-
-                if final_score > 2.0:
+                score = final_score(item)
+                if score > LLM_SCORE_THRESHOLD:
                     ad_obj = ad_map[item.id]
-                    ad_obj.rag_score = float(final_score)
+                    ad_obj.rag_score = score
                     final_results.append(ad_obj)
 
             final_results.sort(key=lambda x: x.rag_score, reverse=True)
@@ -100,6 +150,129 @@ class LLMReranker:
             return adverts
 
 
+class AsyncLLMReranker:
+    """
+    Async `LLMReranker` that splits the candidates into chunks scored
+    concurrently, so latency follows the chunk size rather than the
+    candidate count.
+
+    Each chunk streams its `RankedAdvert` items as the model emits them.
+    A chunk that fails (API error or malformed item) is retried on its own
+    for the listings it has not scored yet; the other chunks are kept.
+    """
+
+    def __init__(self, chunk_size: int = 8, concurrency: int = 4, retries: int = 2):
+        self.openai = openai.AsyncOpenAI()
+        self.client = instructor.from_openai(self.openai)
+        self.chunk_size = chunk_size
+        self.retries = retries
+        self.semaphore = asyncio.Semaphore(concurrency)
+
+    async def stream(
+        self, query: str, constraints: List[str], adverts: List[Advert]
+    ) -> AsyncIterator[Tuple[Advert, float]]:
+        """Yields (advert, score) pairs in arrival order, across all chunks."""
+        queue: asyncio.Queue = asyncio.Queue()
+        chunks = [
+            adverts[i : i + self.chunk_size]
+            for i in range(0, len(adverts), self.chunk_size)
+        ]
+        tasks = [
+            asyncio.create_task(self._score_chunk(query, constraints, chunk, queue))
+            for chunk in chunks
+        ]
+        try:
+            pending = len(tasks)
+            while pending:
+                scored = await queue.get()
+                if scored is None:
+                    pending -= 1
+                else:
+                    yield scored
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    async def rerank(
+        self,
+        query: str,
+        constraints: List[str],
+        adverts: List[Advert],
+        on_update: Optional[Callable[[List[Advert]], Awaitable[None]]] = None,
+    ) -> List[Advert]:
+        """
+        Merges streamed scores into a ranking kept sorted as they arrive.
+        `on_update` receives the partial ranking after every accepted item.
+        Raises RuntimeError if no candidate could be scored at all.
+        """
+        if not adverts:
+            return []
+
+        ranked: List[Advert] = []
+        scored = 0
+        async for ad, score in self.stream(query, constraints, adverts):
+            scored += 1
+            if score <= LLM_SCORE_THRESHOLD:
+                continue
+            ad.rag_score = score
+            bisect.insort(ranked, ad, key=lambda x: -x.rag_score)
+            if on_update is not None:
+                await on_update(ranked)
+        if not scored:
+            raise RuntimeError("LLM reranking scored none of the candidates")
+        return ranked
+
+    async def _score_chunk(
+        self,
+        query: str,
+        constraints: List[str],
+        chunk: List[Advert],
+        queue: asyncio.Queue,
+    ):
+        remaining = {ad.id: ad for ad in chunk}
+        try:
+            for attempt in range(self.retries + 1):
+                try:
+                    async with self.semaphore:
+                        stream = self.client.chat.completions.create_iterable(
+                            model="gpt-4o-mini",
+                            response_model=RankedAdvert,
+                            max_retries=1,
+                            messages=[
+                                {
+                                    "role": "system",
+                                    "content": scoring_prompt(query, constraints),
+                                },
+                                {
+                                    "role": "user",
+                                    "content": format_candidates(
+                                        list(remaining.values())
+                                    ),
+                                },
+                            ],
+                        )
+                        async for item in stream:
+                            ad = remaining.pop(item.id, None)
+                            if ad is not None:
+                                queue.put_nowait((ad, final_score(item)))
+                    if not remaining:
+                        return
+                    logger.warning(
+                        f"LLM rerank chunk skipped {len(remaining)} listings "
+                        f"(attempt {attempt + 1})"
+                    )
+                except Exception as e:
+                    if not remaining:
+                        return
+                    logger.warning(
+                        f"LLM rerank chunk failed (attempt {attempt + 1}): {e}; "
+                        f"{len(remaining)} listings left"
+                    )
+            logger.error(f"Dropping {len(remaining)} listings the LLM failed to score")
+        finally:
+            queue.put_nowait(None)
+
+
 class JinaReranker:
     def __init__(self):
         self.api_url = "https://api.jina.ai/v1/rerank"
@@ -107,50 +280,113 @@ class JinaReranker:
             "Authorization": f"Bearer {settings.JINA_API_KEY}",
             "Content-Type": "application/json",
         }
+        self.client = httpx.AsyncClient()
+        self.cache_hits = 0
+        self.cache_misses = 0
 
-    async def rerank(
+    @property
+    def hit_rate(self) -> float:
+        lookups = self.cache_hits + self.cache_misses
+        return self.cache_hits / lookups if lookups else 0.0
+
+    async def warm_up(self):
+        """Opens the Jina connection ahead of the first rerank."""
+        await self.client.head(self.api_url)
+
+    async def rerank_documents(
         self,
         query: str,
-        adverts: List[Advert],
+        documents: List[str],
         top_k: int = 20,
         threshold: float = 0.3,
-    ) -> List[Advert]:
+    ) -> List[Tuple[int, float]]:
         """
-        Uses Jina AI to rerank documents.
-        Applies a Relevance Threshold to filter out noise.
+        Scores raw documents with Jina AI.
+        Returns (document index, relevance) pairs above the threshold, best first.
+        Raises on API errors (or at once while the Jina circuit is open) so
+        callers can choose their own fallback.
+
+        Scores are cached per (query, document), so "Load More" pages and
+        repeated queries only send the documents not scored before.
+        Documents over RERANK_MAX_TOKENS lose their end; callers that need
+        the end kept cut them first.
         """
-        if not adverts:
+        if not documents:
             return []
 
-        documents = [ad.full_text_content for ad in adverts]
-        payload = {
-            "model": "jina-reranker-v2-base-multilingual",
-            "query": query,
-            "documents": documents,
-            "top_n": top_k,
+        documents = [
+            truncate_tokens(doc, settings.RERANK_MAX_TOKENS) for doc in documents
+        ]
+        keys = rerank_cache_keys(query, documents)
+        cached = await cache.get_many(*keys)
+        scores = {
+            index: score for index, score in enumerate(cached) if score is not None
         }
+        fresh = [index for index in range(len(documents)) if index not in scores]
+        self.cache_hits += len(scores)
+        self.cache_misses += len(fresh)
+        logger.info(
+            f"Rerank cache: {len(scores)}/{len(documents)} hits "
+            f"(overall {self.hit_rate:.0%})"
+        )
 
-        try:
-            async with httpx.AsyncClient() as client:
-                response = await client.post(
+        if fresh:
+            payload = {
+                "model": JINA_RERANK_MODEL,
+                "query": query,
+                "documents": [documents[index] for index in fresh],
+                # Every fresh score is cached, so none are cut by top_n.
+                "top_n": len(fresh),
+                "return_documents": False,
+            }
+            with breaker("jina").guard():
+                response = await self.client.post(
                     self.api_url, headers=self.headers, json=payload
                 )
                 response.raise_for_status()
-                results = response.json().get("results", [])
+            fresh_scores = {
+                fresh[item["index"]]: item["relevance_score"]
+                for item in response.json().get("results", [])
+            }
+            await cache.set_many(
+                {keys[index]: score for index, score in fresh_scores.items()},
+                expire=RERANK_CACHE_TTL,
+            )
+            scores.update(fresh_scores)
 
-            reranked_adverts = []
-            for item in results:
-                score = item["relevance_score"]
-                if score < threshold:
-                    continue
+        ranked = sorted(
+            ((index, score) for index, score in scores.items() if score >= threshold),
+            key=lambda item: item[1],
+            reverse=True,
+        )
+        return ranked[:top_k]
 
-                index = item["index"]
-                ad = adverts[index]
-                ad.rag_score = score
-                reranked_adverts.append(ad)
+    async def rerank(
+        self,
+        query: str,
+        adverts: List[Advert],
+        top_k: int = 20,
+        threshold: float = 0.3,
+    ) -> List[Advert]:
+        """
+        Uses Jina AI to rerank documents.
+        Applies a Relevance Threshold to filter out noise.
+        """
+        if not adverts:
+            return []
 
-            return reranked_adverts
+        documents = [ad.full_text_content for ad in adverts]
 
+        try:
+            ranked = await self.rerank_documents(query, documents, top_k, threshold)
         except Exception as e:
             logger.error(f"Jina Reranking failed: {e}")
             return adverts[:top_k]
+
+        reranked_adverts = []
+        for index, score in ranked:
+            ad = adverts[index]
+            ad.rag_score = score
+            reranked_adverts.append(ad)
+
+        return reranked_adverts
@@ -1,17 +1,76 @@
-from typing import Dict, Any, List, Set, Optional, Tuple
-from src.models import InfrastructureFilter
+from typing import TYPE_CHECKING, Dict, List, Set, Optional, Tuple
+from src.models import (
+    AdvertShow,
+    InfrastructureFilter,
+    InfrastructureResponse,
+    Listing,
+    PlaceRecord,
+    SearchQuery,
+)
+from src.models.batch import AdvertRow
+from src.utils.lazy import lazy_import
+from src.utils.text_processing import parse_room_count
+
+if TYPE_CHECKING:
+    import price_parser
+else:
+    price_parser = lazy_import("price_parser")
 
 
 class DataExtractor:
     @staticmethod
-    def parse_original_text(response_data: Dict[str, Any]) -> str:
-        if not response_data:
-            return ""
-        return response_data.get("text", "").strip()
+    def parse_price(listing: Listing) -> int:
+        price_val = str(listing.price or listing.price_title or "0")
+        return int(price_parser.Price.fromstring(price_val).amount or 0)
+
+    @staticmethod
+    def passes_hard_filters(listing: Listing, query: SearchQuery) -> bool:
+        """
+        Re-checks the price and room filters the search API was given.
+        Unknown prices and room counts pass.
+        """
+        price = DataExtractor.parse_price(listing)
+        if price and query.price_from and price < query.price_from:
+            return False
+        if price and query.price_to and price > query.price_to:
+            return False
+        rooms = parse_room_count(listing.title)
+        return not (rooms and query.room_count and rooms not in query.room_count)
+
+    @staticmethod
+    def to_row(listing: Listing, description: str) -> AdvertRow:
+        """Combines a search listing with its description into a batch row."""
+        return (
+            listing.id,
+            DataExtractor.parse_price(listing),
+            parse_room_count(listing.title),
+            listing.title,
+            listing.geo.address_title,
+            listing.geo.district,
+            description,
+        )
+
+    @staticmethod
+    def parse_original_text(response_data: AdvertShow) -> str:
+        return response_data.text.strip()
+
+    @staticmethod
+    def compact_places(response_data: InfrastructureResponse) -> List[PlaceRecord]:
+        """Flattens the infrastructure sections into compact place records."""
+        return [
+            PlaceRecord(
+                place.category,
+                place.name,
+                place.title,
+                str(place.distance) if place.distance else "",
+            )
+            for section in response_data.data
+            for place in section.places
+        ]
 
     @staticmethod
     def parse_infrastructure(
-        response_data: Dict[str, Any],
+        places: List[PlaceRecord],
         filters: List[InfrastructureFilter],
         operator: str = "AND",
     ) -> str:
@@ -20,15 +79,14 @@ class DataExtractor:
         Supports AND/OR logic between filters.
 
         Args:
-            response_data: Raw API response from infrastructure endpoint
+            places: Compact places near the advert (see `compact_places`)
             filters: List of InfrastructureFilter objects
             operator: "AND" (all filters must match) or "OR" (at least one must match)
 
         Returns:
             Formatted string of matched infrastructure, or empty string if filters not satisfied
         """
-        data = response_data.get("data", [])
-        if not data or not filters:
+        if not places or not filters:
             return ""
 
         filter_map: Dict[str, Set[Optional[str]]] = {}
@@ -39,32 +97,31 @@ class DataExtractor:
             filter_map[cat].add(f.name_match.lower() if f.name_match else None)
 
         matched_filters: Set[Tuple[str, Optional[str]]] = set()
-        matched_places: List[Dict[str, Any]] = []
+        matched_places: List[PlaceRecord] = []
 
         required_filters: Set[Tuple[str, Optional[str]]] = {
             (f.category.lower(), f.name_match.lower() if f.name_match else None)
             for f in filters
         }
 
-        for section in data:
-            for place in section.get("places", []):
-                p_cat = place.get("category", "").lower()
-                p_name = place.get("name", "")
+        for place in places:
+            p_cat = place.category.lower()
+            p_name = place.name
 
-                if p_cat not in filter_map:
-                    continue
+            if p_cat not in filter_map:
+                continue
 
-                name_matches = filter_map[p_cat]
+            name_matches = filter_map[p_cat]
 
-                for name_match in name_matches:
-                    if name_match is None:
-                        matched_filters.add((p_cat, None))
-                        matched_places.append(place)
-                        break
-                    elif name_match in p_name.lower():
-                        matched_filters.add((p_cat, name_match))
-                        matched_places.append(place)
-                        break
+            for name_match in name_matches:
+                if name_match is None:
+                    matched_filters.add((p_cat, None))
+                    matched_places.append(place)
+                    break
+                elif name_match in p_name.lower():
+                    matched_filters.add((p_cat, name_match))
+                    matched_places.append(place)
+                    break
 
         if operator == "AND":
             if not required_filters.issubset(matched_filters):
@@ -78,9 +135,9 @@ class DataExtractor:
 
         grouped: Dict[str, List[str]] = {}
         for place in matched_places:
-            p_title = place.get("title", "Инфраструктура")
-            p_name = place.get("name", "")
-            dist = place.get("distance", "")
+            p_title = place.title or "Инфраструктура"
+            p_name = place.name
+            dist = place.distance
 
             place_str = f"{p_name} ({dist})" if dist else p_name
 
@@ -90,8 +147,8 @@ class DataExtractor:
                 grouped[p_title].append(place_str)
 
         text_parts = []
-        for title, places in grouped.items():
-            joined = ", ".join(places)
+        for title, place_strs in grouped.items():
+            joined = ", ".join(place_strs)
             text_parts.append(f"{title}: {joined}")
 
         return ". ".join(text_parts)
@@ -1,119 +1,359 @@
-import faiss
-import numpy as np
-from openai import OpenAI
-from rank_bm25 import BM25Okapi
-from typing import List
+import threading
+import time
+from concurrent.futures import CancelledError, Future, ThreadPoolExecutor
+from loguru import logger
+from typing import TYPE_CHECKING, Any, Dict, Iterable, List, Optional, Tuple
 from src.config.settings import settings
+from src.services.ann_index import build_index, search_parameters
+from src.services.breaker import CircuitOpenError, breaker
+from src.services.local_embeddings import hashing_embeddings
 from src.models import Advert
-from src.utils.text_processing import clean_text_content
+from src.utils.lazy import lazy_import
+from src.utils.text_processing import (
+    clean_corpus,
+    clean_text_content,
+    estimate_tokens,
+    truncate_tokens,
+)
+
+if TYPE_CHECKING:
+    import faiss
+    import numpy as np
+    import openai
+    import rank_bm25
+else:
+    faiss = lazy_import("faiss")
+    np = lazy_import("numpy")
+    openai = lazy_import("openai")
+    rank_bm25 = lazy_import("rank_bm25")
 
 OPENAI_EMBEDDING_MODEL = "text-embedding-3-small"
 EMBEDDING_DIMENSION = 1536
+EMBEDDING_BACKENDS = ("openai", "hashing")
+
+# Per-request limits of the embeddings endpoint.
+MAX_INPUTS_PER_REQUEST = 2048
+RETRY_BACKOFF = 0.5
+
+_client: Optional["openai.OpenAI"] = None
+_pool: Optional[ThreadPoolExecutor] = None
+
+
+class EmbeddingError(RuntimeError):
+    """Embeddings could not be generated, even after retries."""
+
+
+def embedding_client() -> "openai.OpenAI":
+    """
+    Process-wide OpenAI client. Building one (TLS context, connection pool)
+    blocks for tens of milliseconds, too long to repeat per request on the
+    event loop.
+    """
+    global _client
+    if _client is None:
+        _client = openai.OpenAI(api_key=settings.OPENAI_API_KEY)
+    return _client
+
+
+def embedding_dimension(backend: Optional[str] = None) -> int:
+    """Vector size of an embedding backend (default: the configured one)."""
+    if (backend or settings.EMBEDDING_BACKEND) == "hashing":
+        return settings.LOCAL_EMBEDDING_DIMENSION
+    return EMBEDDING_DIMENSION
+
+
+def embedding_pool() -> ThreadPoolExecutor:
+    """
+    Threads for concurrent embedding requests. Separate from the CPU pool:
+    its workers block on these requests, so sharing it could deadlock.
+    """
+    global _pool
+    if _pool is None:
+        _pool = ThreadPoolExecutor(
+            max_workers=settings.EMBEDDING_CONCURRENCY, thread_name_prefix="embed"
+        )
+    return _pool
+
+
+def pack_batches(texts: List[str], max_tokens: int) -> List[Tuple[int, int]]:
+    """
+    Splits texts, in order, into (start, end) ranges of at most `max_tokens`
+    estimated tokens and MAX_INPUTS_PER_REQUEST inputs each.
+    """
+    batches = []
+    start, tokens = 0, 0
+    for i, text in enumerate(texts):
+        cost = estimate_tokens(text)
+        if i > start and (
+            tokens + cost > max_tokens or i - start >= MAX_INPUTS_PER_REQUEST
+        ):
+            batches.append((start, i))
+            start, tokens = i, 0
+        tokens += cost
+    if start < len(texts):
+        batches.append((start, len(texts)))
+    return batches
+
+
+def score_bm25(corpus: List[str], query: str) -> "np.ndarray":
+    """
+    One-shot BM25 scores of the query against a cleaned corpus. A plain
+    function so the process pool can run it.
+    """
+    tokens = clean_text_content(query).split(" ")
+    return rank_bm25.BM25Okapi([doc.split(" ") for doc in corpus]).get_scores(tokens)
 
 
 class VectorEngine:
-    def __init__(self):
-        self.client = OpenAI(api_key=settings.OPENAI_API_KEY)
-        self.index = None
+    def __init__(self, backend: Optional[str] = None):
+        self.backend = backend or settings.EMBEDDING_BACKEND
+        if self.backend not in EMBEDDING_BACKENDS:
+            raise ValueError(f"Unknown embedding backend: {self.backend}")
+        self.client = embedding_client() if self.backend == "openai" else None
+        # Set when OpenAI failed and the corpus was embedded locally instead.
+        self.fell_back = False
+        self.index: Any = None
+        self.embeddings: Optional[np.ndarray] = None
         self.adverts: List[Advert] = []
-        self.bm25 = None
+        self.corpus: List[str] = []
+        self.bm25: Any = None
 
-    def _get_embeddings(self, texts: List[str]) -> np.ndarray:
+    def _get_embeddings(
+        self, texts: List[str], cancel_event: Optional[threading.Event] = None
+    ) -> "np.ndarray":
         """
-        Generates embeddings using OpenAI API with batching.
+        Generates embeddings using OpenAI API with token-packed batches sent
+        concurrently. Stops dispatching once `cancel_event` is set.
+        The "hashing" backend computes them locally instead.
         """
         if not texts:
             return np.array([])
+        if self.backend == "hashing":
+            return hashing_embeddings(texts, settings.LOCAL_EMBEDDING_DIMENSION)
 
-        clean_texts = [t.replace("\n", " ") for t in texts]
+        clean_texts = [
+            truncate_tokens(t.replace("\n", " "), settings.EMBEDDING_MAX_TOKENS)
+            for t in texts
+        ]
+        embeddings = np.zeros((len(clean_texts), EMBEDDING_DIMENSION), dtype="float32")
+        # Empty documents are rejected by the API; they keep a zero vector.
+        positions = [i for i, text in enumerate(clean_texts) if text.strip()]
+        batches = pack_batches(
+            [clean_texts[i] for i in positions], settings.EMBEDDING_BATCH_TOKENS
+        )
 
-        all_embeddings = []
-        batch_size = 100
+        futures: List[Future] = []
+        for start, end in batches:
+            if cancel_event is not None and cancel_event.is_set():
+                for future in futures:
+                    future.cancel()
+                raise CancelledError("Embedding cancelled")
+            futures.append(
+                embedding_pool().submit(
+                    self._embed_batch,
+                    [clean_texts[i] for i in positions[start:end]],
+                    cancel_event,
+                )
+            )
+        try:
+            for (start, end), future in zip(batches, futures):
+                embeddings[positions[start:end]] = future.result()
+        finally:
+            for future in futures:
+                future.cancel()
+        return embeddings
 
-        for i in range(0, len(clean_texts), batch_size):
-            batch = clean_texts[i : i + batch_size]
-            try:
+    def _embed_batch(
+        self,
+        batch: List[str],
+        cancel_event: Optional[threading.Event] = None,
+        attempt: int = 0,
+    ) -> List[List[float]]:
+        """
+        One embeddings request. A rejected batch (400) is split in half
+        until the offending document is isolated; only that document gets a
+        zero vector. Other failures retry the same batch with backoff (on
+        top of the client's own retries) and then raise EmbeddingError, as
+        does an open embeddings circuit.
+        """
+        if cancel_event is not None and cancel_event.is_set():
+            raise CancelledError("Embedding cancelled")
+        assert self.client is not None
+        try:
+            with breaker("openai-embeddings").guard(ignore=(openai.BadRequestError,)):
                 response = self.client.embeddings.create(
                     input=batch, model=OPENAI_EMBEDDING_MODEL
                 )
-                batch_embeddings = [data.embedding for data in response.data]
-                all_embeddings.extend(batch_embeddings)
-            except Exception as e:
-                print(f"Error generating embeddings for batch {i}: {e}")
-                all_embeddings.extend([[0.0] * EMBEDDING_DIMENSION] * len(batch))
+            return [data.embedding for data in response.data]
+        except CircuitOpenError as e:
+            raise EmbeddingError(str(e)) from e
+        except openai.BadRequestError as e:
+            if len(batch) == 1:
+                logger.warning(f"Embedding rejected a document: {e}")
+                return [[0.0] * EMBEDDING_DIMENSION]
+            middle = len(batch) // 2
+            return self._embed_batch(
+                batch[:middle], cancel_event, attempt
+            ) + self._embed_batch(batch[middle:], cancel_event, attempt)
+        except Exception as e:
+            if attempt >= settings.EMBEDDING_RETRIES:
+                raise EmbeddingError(f"Embedding {len(batch)} texts failed: {e}") from e
+            logger.warning(f"Embedding {len(batch)} texts failed, retrying: {e}")
+            time.sleep(RETRY_BACKOFF * 2**attempt)
+            return self._embed_batch(batch, cancel_event, attempt + 1)
 
-        return np.array(all_embeddings, dtype="float32")
+    def index_data(
+        self, adverts: List[Advert], cancel_event: Optional[threading.Event] = None
+    ):
+        """Indexes Advert models; `search` then maps hits back to them."""
+        self.adverts = adverts
+        self.index_texts([ad.full_text_content for ad in adverts], cancel_event)
 
-    def index_data(self, adverts: List[Advert]):
+    def index_texts(
+        self, texts: Iterable[str], cancel_event: Optional[threading.Event] = None
+    ):
         """
         1. Cleans text.
         2. Generates OpenAI Embeddings.
         3. Creates FAISS index (Dense Retrieval).
         4. Creates BM25 index (Sparse Retrieval).
         """
-        self.adverts = adverts
-        if not adverts:
+        self.prepare_corpus(texts)
+        if not self.corpus:
             return
+        self.build_dense(cancel_event)
+        self.build_bm25()
 
-        corpus = [clean_text_content(ad.full_text_content) for ad in adverts]
+    def prepare_corpus(self, texts: Iterable[str]):
+        """
+        Cleans the documents. The dense and sparse indexes are built from
+        this corpus and can be built concurrently once it is ready.
+        """
+        self.load_corpus(clean_corpus(list(texts)))
 
-        embeddings = self._get_embeddings(corpus)
+    def load_corpus(self, corpus: List[str]):
+        """Uses an already cleaned corpus (e.g. cleaned in the process pool)."""
+        self.index = None
+        self.embeddings = None
+        self.bm25 = None
+        self.corpus = corpus
 
+    def embed(
+        self, corpus: List[str], cancel_event: Optional[threading.Event] = None
+    ) -> "np.ndarray":
+        """
+        L2-normalized embeddings of cleaned documents. Identical documents
+        (reposts) are embedded once and share the vector.
+        """
+        positions: Dict[str, int] = {}
+        inverse = [positions.setdefault(doc, len(positions)) for doc in corpus]
+        embeddings = self._get_embeddings(list(positions), cancel_event)
         faiss.normalize_L2(embeddings)
+        if len(positions) == len(corpus):
+            return embeddings
+        return embeddings[inverse]
 
-        self.index = faiss.IndexFlatIP(EMBEDDING_DIMENSION)
-        self.index.add(embeddings)
-
-        tokenized_corpus = [doc.split(" ") for doc in corpus]
-        self.bm25 = BM25Okapi(tokenized_corpus)
+    def build_dense(self, cancel_event: Optional[threading.Event] = None):
+        self.embed_corpus(cancel_event)
+        self.index_embeddings()
 
-    def search(self, query: str, top_k: int = 20) -> List[Advert]:
+    def embed_corpus(self, cancel_event: Optional[threading.Event] = None):
         """
-        Hybrid Search: Combines OpenAI Vector similarity with BM25 re-ranking.
+        Embeds the corpus. With EMBEDDING_FALLBACK, failed OpenAI embeddings
+        are replaced by local ones, and the engine then embeds queries
+        locally too (`fell_back`).
         """
-        if not self.adverts or self.index is None:
-            return []
+        try:
+            self.embeddings = self.embed(self.corpus, cancel_event)
+        except EmbeddingError as e:
+            if self.backend == "hashing" or not settings.EMBEDDING_FALLBACK:
+                raise
+            logger.warning(f"{e}; embedding locally instead")
+            self.backend = "hashing"
+            self.fell_back = True
+            self.embeddings = self.embed(self.corpus, cancel_event)
+
+    def index_embeddings(self):
+        """Builds the FAISS index over the embedded corpus (CPU-bound)."""
+        self.index = build_index(self.embeddings)
+
+    def build_bm25(self):
+        if self.bm25 is None:
+            tokenized_corpus = [doc.split(" ") for doc in self.corpus]
+            self.bm25 = rank_bm25.BM25Okapi(tokenized_corpus)
 
+    def dense_search(
+        self, query: str, search_k: int = 100
+    ) -> "Tuple[np.ndarray, np.ndarray]":
+        """Returns (candidate indices, cosine scores) from the FAISS index."""
+        return self.search_embedding(self.embed_query(query), search_k)
+
+    def embed_query(self, query: str) -> "np.ndarray":
         query_embedding = self._get_embeddings([query])
         faiss.normalize_L2(query_embedding)
+        return query_embedding
 
-        search_k = min(100, len(self.adverts))
-        D, Indexies = self.index.search(query_embedding, k=search_k)
-
-        candidate_indices = Indexies[0]
-        vector_scores = D[0]
+    def search_embedding(
+        self, query_embedding: "np.ndarray", search_k: int = 100
+    ) -> "Tuple[np.ndarray, np.ndarray]":
+        search_k = min(search_k, len(self.corpus))
+        D, Indexies = self.index.search(
+            query_embedding, k=search_k, params=search_parameters(self.index)
+        )
+        return Indexies[0], D[0]
 
+    def bm25_scores(self, query: str) -> "np.ndarray":
+        """BM25 scores of the query against every indexed document."""
+        self.build_bm25()
         clean_query = clean_text_content(query)
         tokenized_query = clean_query.split(" ")
+        return self.bm25.get_scores(tokenized_query)
 
-        all_bm25_scores = self.bm25.get_scores(tokenized_query)
-
-        candidate_bm25_scores = []
-        for idx in candidate_indices:
-            if idx != -1:
-                candidate_bm25_scores.append(all_bm25_scores[idx])
-            else:
-                candidate_bm25_scores.append(0.0)
-
-        if candidate_bm25_scores:
-            max_bm25 = max(candidate_bm25_scores)
-            if max_bm25 > 0:
-                candidate_bm25_scores = [s / max_bm25 for s in candidate_bm25_scores]
+    @staticmethod
+    def fuse(
+        candidate_indices: "np.ndarray",
+        vector_scores: "np.ndarray",
+        candidate_bm25_scores: "Optional[np.ndarray]",
+        top_k: int = 20,
+        alpha: float = 0.7,
+    ) -> List[Tuple[int, float]]:
+        """
+        Blends vector and normalized BM25 scores of the dense candidates.
+        BM25 scores are aligned with `candidate_indices`; without them the
+        candidates keep their vector order.
+        Returns (document index, hybrid score) pairs, best first.
+        """
+        valid = candidate_indices != -1
+        if candidate_bm25_scores is None:
+            alpha = 1.0
+            candidate_bm25_scores = np.zeros(len(candidate_indices))
 
-        alpha = 0.7
-        hybrid_results = []
+        bm25 = np.where(valid, candidate_bm25_scores, 0.0)
+        max_bm25 = bm25.max() if len(bm25) else 0.0
+        if max_bm25 > 0:
+            bm25 = bm25 / max_bm25
 
-        for i, idx in enumerate(candidate_indices):
-            if idx == -1:
-                continue
+        final_scores = (alpha * vector_scores) + ((1 - alpha) * bm25)
 
-            v_score = vector_scores[i]
-            b_score = candidate_bm25_scores[i]
+        hybrid_results = [
+            (int(idx), float(score))
+            for idx, score in zip(candidate_indices[valid], final_scores[valid])
+        ]
+        hybrid_results.sort(key=lambda x: x[1], reverse=True)
 
-            final_score = (alpha * v_score) + ((1 - alpha) * b_score)
+        return hybrid_results[:top_k]
 
-            hybrid_results.append({"advert": self.adverts[idx], "score": final_score})
+    def search_rows(self, query: str, top_k: int = 20) -> List[Tuple[int, float]]:
+        """
+        Hybrid Search: Combines OpenAI Vector similarity with BM25 re-ranking.
+        """
+        if not self.corpus or self.index is None:
+            return []
 
-        hybrid_results.sort(key=lambda x: x["score"], reverse=True)
+        candidate_indices, vector_scores = self.dense_search(query)
+        bm25 = self.bm25_scores(query)[candidate_indices]
+        return self.fuse(candidate_indices, vector_scores, bm25, top_k)
 
-        return [item["advert"] for item in hybrid_results[:top_k]]
+    def search(self, query: str, top_k: int = 20) -> List[Advert]:
+        """Hybrid search over adverts indexed with `index_data`."""
+        return [self.adverts[idx] for idx, _ in self.search_rows(query, top_k)]
@@ -0,0 +1,288 @@
+import asyncio
+import time
+from loguru import logger
+from typing import TYPE_CHECKING, Dict, List, Optional, Set, Tuple
+from src.models import AdvertBatch, PlaceRecord, SearchQuery
+from src.services.ann_index import build_index, choose_index_kind, search_parameters
+from src.services.scraper import DataExtractor
+from src.services.vector_store import EMBEDDING_DIMENSION
+from src.utils.executor import run_in_thread
+from src.utils.lazy import lazy_import
+
+if TYPE_CHECKING:
+    import faiss
+    import numpy as np
+    import rank_bm25
+else:
+    faiss = lazy_import("faiss")
+    np = lazy_import("numpy")
+    rank_bm25 = lazy_import("rank_bm25")
+
+CorpusKey = Tuple[str, str]
+
+# Filters this selective are scored exactly; an ANN index would visit most
+# of its graph/lists just to find enough allowed vectors.
+EXACT_SEARCH_MAX_ROWS = 4096
+
+
+class WarmSnapshot:
+    """
+    Immutable columnar view of every warm listing, across all (region, category)
+    pairs, with one shared FAISS index. Row `i` of every column is vector `i`
+    of the index, so hard filters become a boolean mask over the columns that
+    is handed to FAISS as a bitmap selector.
+
+    The store swaps in a new snapshot on every sync; a running search keeps
+    the one it started with. A new snapshot starts with an exact index; once
+    the corpus is large enough (see `ann_index.choose_index_kind`) the store
+    builds an ANN index in the background and swaps in a copy carrying it.
+    """
+
+    __slots__ = (
+        "batch",
+        "region_ids",
+        "category_ids",
+        "added_at",
+        "corpus",
+        "places",
+        "embeddings",
+        "index",
+        "_known",
+        "_bm25",
+    )
+
+    def __init__(
+        self,
+        batch: AdvertBatch,
+        region_ids: "np.ndarray",
+        category_ids: "np.ndarray",
+        added_at: "np.ndarray",
+        corpus: List[str],
+        places: List[List[PlaceRecord]],
+        embeddings: "np.ndarray",
+    ):
+        self.batch = batch
+        self.region_ids = region_ids
+        self.category_ids = category_ids
+        self.added_at = added_at
+        self.corpus = corpus
+        self.places = places
+        self.embeddings = embeddings
+        self.index = faiss.IndexFlatIP(embeddings.shape[1])
+        if len(embeddings):
+            self.index.add(embeddings)
+        self._known: Dict[CorpusKey, Set[int]] = {}
+        self._bm25: Dict[CorpusKey, Tuple[np.ndarray, "rank_bm25.BM25Okapi"]] = {}
+
+    @classmethod
+    def empty(cls, dimension: int) -> "WarmSnapshot":
+        return cls(
+            AdvertBatch.from_rows([]),
+            np.empty(0, dtype=np.int32),
+            np.empty(0, dtype=np.int32),
+            np.empty(0, dtype=np.float64),
+            [],
+            [],
+            np.empty((0, dimension), dtype="float32"),
+        )
+
+    def with_index(self, index: "faiss.Index") -> "WarmSnapshot":
+        """The same rows and columns over a different index of them."""
+        snapshot = WarmSnapshot.__new__(WarmSnapshot)
+        for name in self.__slots__:
+            setattr(snapshot, name, getattr(self, name))
+        snapshot.index = index
+        return snapshot
+
+    def __len__(self) -> int:
+        return len(self.batch)
+
+    def pair_mask(self, region_id: str, category_id: str) -> "np.ndarray":
+        return (self.region_ids == int(region_id)) & (
+            self.category_ids == int(category_id)
+        )
+
+    def known_ids(self, region_id: str, category_id: str) -> Set[int]:
+        key = (region_id, category_id)
+        if key not in self._known:
+            mask = self.pair_mask(region_id, category_id)
+            self._known[key] = set(self.batch.ids[mask].tolist())
+        return self._known[key]
+
+    def mask(self, params: SearchQuery) -> "np.ndarray":
+        """
+        Rows of the query's pair within its price and room filters. Unknown
+        (zero) prices and room counts pass, as on the live path
+        (`DataExtractor.passes_hard_filters`).
+        """
+        mask = self.pair_mask(params.region_id, params.category_id)
+        prices, rooms = self.batch.prices, self.batch.rooms
+        if params.price_from:
+            mask &= (prices == 0) | (prices >= params.price_from)
+        if params.price_to:
+            mask &= (prices == 0) | (prices <= params.price_to)
+        if params.room_count:
+            mask &= (rooms == 0) | np.isin(rooms, params.room_count)
+        return mask
+
+    def select(self, params: SearchQuery) -> "np.ndarray":
+        """Rows that satisfy all hard filters, including infrastructure."""
+        rows = np.flatnonzero(self.mask(params))
+        if params.infrastructure_filters:
+            keep = [
+                bool(
+                    DataExtractor.parse_infrastructure(
+                        self.places[row],
+                        filters=params.infrastructure_filters,
+                        operator=params.infrastructure_operator,
+                    )
+                )
+                for row in rows
+            ]
+            rows = rows[np.array(keep, dtype=bool)]
+        return rows
+
+    def search(
+        self, query_embedding: "np.ndarray", rows: "np.ndarray", k: int = 100
+    ) -> "Tuple[np.ndarray, np.ndarray]":
+        """Filtered ANN search restricted to `rows`. Returns (rows, scores)."""
+        if len(rows) <= EXACT_SEARCH_MAX_ROWS:
+            scores = self.embeddings[rows] @ query_embedding[0]
+            top = np.argsort(-scores, kind="stable")[:k]
+            return rows[top], scores[top]
+
+        allowed = np.zeros(len(self), dtype=bool)
+        allowed[rows] = True
+        bitmap = np.packbits(allowed, bitorder="little")
+        selector = faiss.IDSelectorBitmap(len(allowed), faiss.swig_ptr(bitmap))
+        search_params = search_parameters(self.index, selector)
+        D, Indexies = self.index.search(
+            query_embedding, k=min(k, len(rows)), params=search_params
+        )
+        found = Indexies[0] != -1
+        return Indexies[0][found], D[0][found]
+
+    def bm25_scores(
+        self, region_id: str, category_id: str, tokens: List[str], rows: "np.ndarray"
+    ) -> "np.ndarray":
+        """BM25 scores of `rows`, with statistics from their whole pair corpus."""
+        key = (region_id, category_id)
+        if key not in self._bm25:
+            pair_rows = np.flatnonzero(self.pair_mask(region_id, category_id))
+            tokenized = [self.corpus[row].split(" ") for row in pair_rows]
+            self._bm25[key] = (pair_rows, rank_bm25.BM25Okapi(tokenized))
+        pair_rows, bm25 = self._bm25[key]
+        scores = bm25.get_scores(tokens)
+        return scores[np.searchsorted(pair_rows, rows)]
+
+
+class WarmStore:
+    """In-memory warm listings, filled by the `DeltaCrawler`."""
+
+    def __init__(self, max_adverts: int = 20000, dimension: int = EMBEDDING_DIMENSION):
+        self.max_adverts = max_adverts
+        self.snapshot = WarmSnapshot.empty(dimension)
+        self._reindex: Optional[asyncio.Task] = None
+        # Syncs of different pairs merge one at a time, each into the
+        # snapshot the previous one produced.
+        self._adding = asyncio.Lock()
+
+    def has(self, region_id: str, category_id: str) -> bool:
+        return bool(self.snapshot.known_ids(region_id, category_id))
+
+    async def add(
+        self,
+        region_id: str,
+        category_id: str,
+        batch: AdvertBatch,
+        corpus: List[str],
+        embeddings: "np.ndarray",
+        places: List[List[PlaceRecord]],
+    ):
+        """
+        Appends newly crawled adverts, evicting the oldest past `max_adverts`.
+        The merged snapshot copies every row, so it is built in a worker
+        thread; only the swap happens on the event loop.
+        """
+        async with self._adding:
+            self.snapshot = await run_in_thread(
+                self._merge,
+                self.snapshot,
+                region_id,
+                category_id,
+                batch,
+                corpus,
+                embeddings,
+                places,
+            )
+
+    def _merge(
+        self,
+        current: WarmSnapshot,
+        region_id: str,
+        category_id: str,
+        batch: AdvertBatch,
+        corpus: List[str],
+        embeddings: "np.ndarray",
+        places: List[List[PlaceRecord]],
+    ) -> WarmSnapshot:
+        count = len(batch)
+        merged_batch = current.batch.concat(batch)
+        region_ids = np.concatenate(
+            [current.region_ids, np.full(count, int(region_id), dtype=np.int32)]
+        )
+        category_ids = np.concatenate(
+            [current.category_ids, np.full(count, int(category_id), dtype=np.int32)]
+        )
+        # Crawls follow `add_date desc`, so the first-seen time orders adverts
+        # like their publication date.
+        now = time.time()
+        added_at = np.concatenate(
+            [current.added_at, now - np.arange(count, dtype=np.float64) * 1e-3]
+        )
+        merged_corpus = current.corpus + corpus
+        merged_places = current.places + places
+        merged_embeddings = np.vstack([current.embeddings, embeddings])
+
+        if len(merged_batch) > self.max_adverts:
+            keep = np.sort(np.argsort(-added_at, kind="stable")[: self.max_adverts])
+            merged_batch = merged_batch.take(keep.tolist())
+            region_ids = region_ids[keep]
+            category_ids = category_ids[keep]
+            added_at = added_at[keep]
+            merged_corpus = [merged_corpus[row] for row in keep]
+            merged_places = [merged_places[row] for row in keep]
+            merged_embeddings = merged_embeddings[keep]
+
+        return WarmSnapshot(
+            merged_batch,
+            region_ids,
+            category_ids,
+            added_at,
+            merged_corpus,
+            merged_places,
+            merged_embeddings,
+        )
+
+    def schedule_reindex(self):
+        """Rebuilds the ANN index of the latest snapshot in the background."""
+        if self._reindex is None or self._reindex.done():
+            self._reindex = asyncio.create_task(self._reindex_latest())
+
+    async def _reindex_latest(self):
+        while True:
+            snapshot = self.snapshot
+            kind = choose_index_kind(len(snapshot))
+            if kind == "flat":
+                return
+            started = time.monotonic()
+            index = await run_in_thread(build_index, snapshot.embeddings, kind)
+            logger.info(
+                f"Warm index rebuilt as {kind} over {len(snapshot)} vectors "
+                f"in {time.monotonic() - started:.1f}s"
+            )
+            # Syncs that landed meanwhile produced a newer snapshot, which
+            # needs its own index.
+            if self.snapshot is snapshot:
+                self.snapshot = snapshot.with_index(index)
+                return
@@ -0,0 +1,20 @@
+import json
+import zlib
+from typing import Any, Optional
+
+# Bump whenever the shape of packed records changes; older entries then
+# read as cache misses instead of being misinterpreted.
+RECORD_VERSION = 1
+
+
+def pack_record(record: Any) -> bytes:
+    """Serializes a JSON-compatible record as version byte + zlib(JSON)."""
+    payload = json.dumps(record, ensure_ascii=False, separators=(",", ":"))
+    return bytes([RECORD_VERSION]) + zlib.compress(payload.encode("utf-8"))
+
+
+def unpack_record(blob: Optional[bytes]) -> Optional[Any]:
+    """Inverse of `pack_record`. Returns None for empty or outdated blobs."""
+    if not blob or blob[0] != RECORD_VERSION:
+        return None
+    return json.loads(zlib.decompress(blob[1:]))
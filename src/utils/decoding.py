@@ -0,0 +1,19 @@
+from typing import Type, TypeVar
+from pydantic import BaseModel
+from src.utils.executor import run_in_thread
+
+M = TypeVar("M", bound=BaseModel)
+
+# Payloads above this size are decoded off the event loop.
+LARGE_PAYLOAD_BYTES = 64 * 1024
+
+
+async def decode_json(model: Type[M], content: bytes) -> M:
+    """
+    Validates raw response bytes straight into a typed schema.
+    Large payloads are decoded in a worker thread so parsing does not
+    block other requests.
+    """
+    if len(content) >= LARGE_PAYLOAD_BYTES:
+        return await run_in_thread(model.model_validate_json, content)
+    return model.model_validate_json(content)
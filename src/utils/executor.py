@@ -0,0 +1,161 @@
+import asyncio
+import importlib
+import multiprocessing
+import os
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from functools import partial
+from typing import Any, Callable, Deque, Dict, Optional, TypeVar
+from loguru import logger
+from src.config.settings import settings
+
+T = TypeVar("T")
+
+# Imported by every worker process on start, so the first task sent to a
+# worker does not pay for them.
+WORKER_PRELOAD = ("src.services.vector_store",)
+
+_threads: Optional[ThreadPoolExecutor] = None
+_io_threads: Optional[ThreadPoolExecutor] = None
+_processes: Optional[ProcessPoolExecutor] = None
+
+
+def thread_pool() -> ThreadPoolExecutor:
+    global _threads
+    if _threads is None:
+        _threads = ThreadPoolExecutor(
+            max_workers=settings.CPU_THREADS or os.cpu_count() or 4,
+            thread_name_prefix="cpu",
+        )
+    return _threads
+
+
+def io_pool() -> ThreadPoolExecutor:
+    """
+    Threads for blocking calls that mostly wait on the network. Kept apart
+    from the CPU pool, which has one thread per core, so that requests in
+    flight never queue CPU work behind them.
+    """
+    global _io_threads
+    if _io_threads is None:
+        _io_threads = ThreadPoolExecutor(
+            max_workers=settings.IO_THREADS, thread_name_prefix="io"
+        )
+    return _io_threads
+
+
+def process_pool() -> Optional[ProcessPoolExecutor]:
+    """The process pool, or None when CPU_PROCESSES is 0."""
+    global _processes
+    if _processes is None and settings.CPU_PROCESSES > 0:
+        # Spawned workers: forking a process that runs threads (FAISS,
+        # httpx, the thread pool) can deadlock the child.
+        _processes = ProcessPoolExecutor(
+            max_workers=settings.CPU_PROCESSES,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_preload,
+        )
+    return _processes
+
+
+def _preload():
+    for module in WORKER_PRELOAD:
+        importlib.import_module(module)
+
+
+def _worker_pid(_: int) -> int:
+    return os.getpid()
+
+
+def warm_up_pools():
+    """
+    Starts every worker process ahead of the first request. Spawning happens
+    on submit and blocks the caller, so run this in a thread.
+    """
+    pool = process_pool()
+    if pool is not None:
+        list(pool.map(_worker_pid, range(settings.CPU_PROCESSES)))
+
+
+async def run_in_thread(func: Callable[..., T], *args: Any) -> T:
+    """
+    Runs work that releases the GIL (FAISS, NumPy, blocking HTTP) on the
+    shared thread pool.
+    """
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(thread_pool(), partial(func, *args))
+
+
+async def run_io(func: Callable[..., T], *args: Any) -> T:
+    """Runs a blocking call that waits on the network (e.g. embeddings)."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(io_pool(), partial(func, *args))
+
+
+async def run_cpu(func: Callable[..., T], *args: Any) -> T:
+    """
+    Runs pure-Python CPU work (text cleaning, BM25) that holds the GIL.
+    Uses the process pool when configured, so sessions scale across cores;
+    `func` and its arguments must then be picklable.
+    """
+    pool = process_pool()
+    if pool is None:
+        return await run_in_thread(func, *args)
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(pool, partial(func, *args))
+
+
+def shutdown_pools():
+    global _threads, _io_threads, _processes
+    if _processes is not None:
+        _processes.shutdown(wait=False, cancel_futures=True)
+        _processes = None
+    if _threads is not None:
+        _threads.shutdown(wait=False, cancel_futures=True)
+        _threads = None
+    if _io_threads is not None:
+        _io_threads.shutdown(wait=False, cancel_futures=True)
+        _io_threads = None
+
+
+class LoopLagMonitor:
+    """
+    Measures event-loop lag: how late a periodic wake-up fires. Sustained
+    lag means something is running on the loop that belongs in a pool.
+    """
+
+    def __init__(self, interval: float = 0.5, window: int = 240):
+        self.interval = interval
+        self.samples: Deque[float] = deque(maxlen=window)
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run_forever())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.wait({self._task})
+            self._task = None
+
+    async def _run_forever(self):
+        while True:
+            started = time.monotonic()
+            await asyncio.sleep(self.interval)
+            lag = time.monotonic() - started - self.interval
+            self.samples.append(lag)
+            if lag > settings.LOOP_LAG_WARN:
+                logger.warning(f"Event loop blocked for {lag * 1000:.0f} ms")
+
+    def stats(self) -> Dict[str, float]:
+        """Mean, p99 and max lag (seconds) over the recent window."""
+        if not self.samples:
+            return {"mean": 0.0, "p99": 0.0, "max": 0.0}
+        ordered = sorted(self.samples)
+        return {
+            "mean": sum(ordered) / len(ordered),
+            "p99": ordered[min(len(ordered) - 1, int(len(ordered) * 0.99))],
+            "max": ordered[-1],
+        }
@@ -1,5 +1,20 @@
-import ftfy
-from cleantext import clean
+import re
+from typing import TYPE_CHECKING, List
+from src.utils.lazy import lazy_import
+
+if TYPE_CHECKING:
+    import cleantext
+    import ftfy
+else:
+    cleantext = lazy_import("cleantext")
+    ftfy = lazy_import("ftfy")
+
+ROOM_COUNT_PATTERN = re.compile(r"(\d+)\s*-?\s*(?:комн|бөлме|room)", re.IGNORECASE)
+
+# No tokenizer is a dependency, so tokens are estimated from UTF-8 bytes.
+# BPE tokenizers average ~4 bytes per token for English and ~5-6 for
+# Cyrillic, so 3 bytes per token over-counts and keeps requests in limits.
+BYTES_PER_TOKEN = 3
 
 
 def clean_text_content(text: str) -> str:
@@ -14,7 +29,7 @@ def clean_text_content(text: str) -> str:
     text = ftfy.fix_text(text)
 
     # Normalize
-    text = clean(
+    text = cleantext.clean(
         text,
         fix_unicode=True,
         to_ascii=False,
@@ -27,3 +42,30 @@ def clean_text_content(text: str) -> str:
         no_digits=False,
     )
     return text
+
+
+def clean_corpus(texts: List[str]) -> List[str]:
+    """Cleans a batch of documents (picklable, for the process pool)."""
+    return [clean_text_content(text) for text in texts]
+
+
+def parse_room_count(title: str) -> int:
+    """
+    Extracts the room count from a listing title
+    (e.g. "2-комнатная квартира · 45 м²" -> 2). Returns 0 if unknown.
+    """
+    match = ROOM_COUNT_PATTERN.search(title or "")
+    return int(match.group(1)) if match else 0
+
+
+def estimate_tokens(text: str) -> int:
+    return len(text.encode("utf-8")) // BYTES_PER_TOKEN + 1
+
+
+def truncate_tokens(text: str, max_tokens: int) -> str:
+    """Cuts text to roughly `max_tokens` tokens (never more)."""
+    data = text.encode("utf-8")
+    limit = (max_tokens - 1) * BYTES_PER_TOKEN
+    if len(data) <= limit:
+        return text
+    return data[:limit].decode("utf-8", errors="ignore")